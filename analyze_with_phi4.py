@@ -10,89 +10,286 @@ Document Intelligence and sending it to Phi-4 for deeper analysis:
 Usage:
   python analyze_with_phi4.py <path_to_pdf>
   python analyze_with_phi4.py <path_to_pdf> --question "What is the total amount due?"
+  python analyze_with_phi4.py --files "invoices/*.pdf" --concurrency 4
+  python analyze_with_phi4.py --batch a.pdf b.pdf c.pdf
+
+Layout results are cached under ~/.cache/azure-di keyed by a hash of the
+file contents, so asking a new question about the same document skips the
+Document Intelligence call. Pass --no-cache to force a fresh analysis.
 """
 
 import os
 import sys
+import glob
 import json
+import time
+import atexit
+import hashlib
+import tempfile
 import argparse
+import orjson
 import requests
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from collections import ChainMap
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from dotenv import load_dotenv
 from azure.core.credentials import AzureKeyCredential
 from azure.ai.documentintelligence import DocumentIntelligenceClient
 
 
+# Attempts per Phi-4 request before a 429 is treated as fatal
+_MAX_ATTEMPTS = 6
+
+# One pooled HTTP session for every Phi-4 call, so repeated requests reuse
+# the same keep-alive connection instead of paying a new TLS handshake.
+# Connection errors and 5xx are retried by the adapter; 429 is handled in
+# _post_with_backoff() so quota waits can be reported.
+_SESSION = requests.Session()
+_SESSION.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=8,
+        pool_maxsize=32,
+        max_retries=Retry(
+            total=_MAX_ATTEMPTS,
+            backoff_factor=1.0,
+            backoff_jitter=0.5,
+            status_forcelist=[500, 502, 503, 504],
+            allowed_methods=["POST"],
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        ),
+    ),
+)
+atexit.register(_SESSION.close)
+
+
+# Where extracted layout results are cached, keyed by content hash
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "azure-di")
+
+# Read size used when hashing documents
+_CHUNK_SIZE = 1 << 20
+
+# Flattens line breaks and tabs to spaces in a single pass
+_NL_TABLE = str.maketrans("\n\r\t", "   ")
+
+# Checkbox glyph by selection-mark state (anything else is unchecked)
+_mark_glyph = {"selected": "☑"}.get
+
+# Stands in for a section turned off with --no-tables / --no-selection-marks,
+# so neither Phi-4 nor the stats read it as "the document has none"
+NOT_EXTRACTED = "(not extracted)"
+
+
 # ────────────────────────────────────────────────────────────
 # 1.  DOCUMENT INTELLIGENCE — Extract structured text
 # ────────────────────────────────────────────────────────────
 
-def extract_layout_text(file_path: str, endpoint: str, key: str) -> dict:
-    """Run the prebuilt-layout model and return structured sections."""
-
-    client = DocumentIntelligenceClient(
-        endpoint=endpoint,
-        credential=AzureKeyCredential(key),
-    )
-
+def _file_fingerprint(file_path: str) -> str:
+    """BLAKE2b hash of a file's contents, read in fixed-size chunks."""
+    digest = hashlib.blake2b(digest_size=16)
     with open(file_path, "rb") as f:
-        poller = client.begin_analyze_document("prebuilt-layout", body=f)
+        while chunk := f.read(_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _load_cached(fingerprint: str) -> dict | None:
+    """Return the cached extraction for a content hash, if there is one."""
+    try:
+        with open(os.path.join(CACHE_DIR, f"{fingerprint}.json"),
+                  encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _store_cached(fingerprint: str, extracted: dict):
+    """Write an extraction to the cache atomically (temp file + rename)."""
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=CACHE_DIR, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(extracted, f, ensure_ascii=False)
+        os.replace(tmp_path, os.path.join(CACHE_DIR, f"{fingerprint}.json"))
+    except OSError as exc:
+        print(f"  WARNING: could not write layout cache: {exc}")
+
+
+def _fmt_paragraph(p) -> str | None:
+    """Format one paragraph as markdown, or None for page furniture."""
+    role = p.role or "text"
+    if role in ("pageHeader", "pageFooter", "pageNumber"):
+        return None
+    content = p.content.translate(_NL_TABLE)
+    if role == "title":
+        return f"# {content}"
+    if role == "sectionHeading":
+        return f"## {content}"
+    return content
+
+
+def table_to_markdown(table) -> str:
+    """Render a DI table as a markdown grid (header row + separator)."""
+    cols = table.column_count
+    # Row lists are built by C-level list repetition, then filled in place
+    grid = [[""] * cols for _ in range(table.row_count)]
+    for cell in table.cells:
+        grid[cell.row_index][cell.column_index] = (
+            cell.content.translate(_NL_TABLE).strip()
+        )
+    if not grid:
+        return ""
+
+    rows = ["| " + " | ".join(row) + " |" for row in grid]
+    rows.insert(1, "| " + " | ".join(["---"] * cols) + " |")
+    return "\n".join(rows)
+
+
+def _cache_key(fingerprint: str, pages, features, tables, selection_marks) -> str:
+    """Cache key for a file hash plus the options that change the extraction."""
+    options = (pages, sorted(map(str, features or ())), tables, selection_marks)
+    if options == (None, [], True, True):
+        return fingerprint
+    if not (tables and selection_marks):
+        # Older entries for these options held "" / "None" for the skipped
+        # sections; keying on the placeholder keeps them from being reused
+        options += (NOT_EXTRACTED,)
+    suffix = hashlib.blake2b(repr(options).encode(), digest_size=4).hexdigest()
+    return f"{fingerprint}-{suffix}"
+
+
+def extract_layout_text(file_path: str, endpoint: str, key: str,
+                        client: DocumentIntelligenceClient | None = None,
+                        use_cache: bool = True,
+                        pages: str | None = None,
+                        features: list | None = None,
+                        tables: bool = True,
+                        selection_marks: bool = True) -> dict:
+    """
+    Run the prebuilt-layout model and return structured sections.
+
+    Pass an existing ``client`` to reuse its connection pool across calls;
+    otherwise a new one is created from ``endpoint`` and ``key``. Results
+    are cached by a BLAKE2b hash of the file contents unless ``use_cache``
+    is False.
+
+    ``pages`` (e.g. "1-5,8") limits the pages DI analyzes, and ``features``
+    lists the add-on features to request (none by default). ``tables`` and
+    ``selection_marks`` can be turned off to skip building those sections.
+    """
+
+    if use_cache:
+        fingerprint = _cache_key(_file_fingerprint(file_path), pages, features,
+                                 tables, selection_marks)
+        cached = _load_cached(fingerprint)
+        if cached is not None:
+            return cached
+
+    if client is None:
+        client = DocumentIntelligenceClient(
+            endpoint=endpoint,
+            credential=AzureKeyCredential(key),
+        )
+
+    # Hand the SDK the open file rather than its bytes: the transport streams
+    # it from disk, and retries can rewind it.
+    with open(file_path, "rb") as f:
+        poller = client.begin_analyze_document(
+            "prebuilt-layout", body=f, content_type="application/octet-stream",
+            # None leaves the query parameter off; an empty list would send
+            # a blank `features=` that the service rejects.
+            pages=pages, features=features or None,
+        )
     result = poller.result()
 
     # --- paragraphs (with roles) ---
-    paragraphs_text = []
-    if result.paragraphs:
-        for p in result.paragraphs:
-            role = p.role or "text"
-            content = p.content.replace("\n", " ")
-            if role in ("pageHeader", "pageFooter", "pageNumber"):
-                continue
-            if role == "title":
-                paragraphs_text.append(f"# {content}")
-            elif role == "sectionHeading":
-                paragraphs_text.append(f"## {content}")
-            else:
-                paragraphs_text.append(content)
+    paragraphs_text = "\n".join(
+        s for s in map(_fmt_paragraph, result.paragraphs or ()) if s is not None
+    )
 
     # --- tables (markdown format) ---
-    tables_text = []
-    if result.tables:
-        for idx, table in enumerate(result.tables, 1):
-            grid = [["" for _ in range(table.column_count)]
-                    for _ in range(table.row_count)]
-            for cell in table.cells:
-                grid[cell.row_index][cell.column_index] = (
-                    cell.content.replace("\n", " ").strip()
-                )
-            md_rows = []
-            for row_idx, row in enumerate(grid):
-                md_rows.append("| " + " | ".join(row) + " |")
-                if row_idx == 0:
-                    md_rows.append("| " + " | ".join("---" for _ in row) + " |")
-            tables_text.append(f"### Table {idx}\n" + "\n".join(md_rows))
+    tables_text = "\n\n".join(
+        f"### Table {idx}\n" + table_to_markdown(table)
+        for idx, table in enumerate(result.tables or (), 1)
+    ) if tables else NOT_EXTRACTED
 
     # --- selection marks ---
-    marks_text = []
-    for page in result.pages:
-        if page.selection_marks:
-            for m in page.selection_marks:
-                state = "☑" if m.state == "selected" else "☐"
-                marks_text.append(f"{state} (page {page.page_number})")
-
-    return {
-        "paragraphs": "\n".join(paragraphs_text),
-        "tables": "\n\n".join(tables_text),
-        "selection_marks": ", ".join(marks_text) if marks_text else "None",
+    marks_text = (", ".join(
+        f"{_mark_glyph(m.state, '☐')} (page {page.page_number})"
+        for page in result.pages
+        for m in (page.selection_marks or ())
+    ) or "None") if selection_marks else NOT_EXTRACTED
+
+    extracted = {
+        "paragraphs": paragraphs_text,
+        "tables": tables_text,
+        "selection_marks": marks_text,
         "page_count": len(result.pages),
         "model_id": result.model_id,
     }
+    if use_cache:
+        _store_cached(fingerprint, extracted)
+    return extracted
 
 
 # ────────────────────────────────────────────────────────────
 # 2.  PHI-4 MULTIMODAL — Analyze extracted content
 # ────────────────────────────────────────────────────────────
 
-def call_phi4(endpoint: str, key: str, system_prompt: str, user_prompt: str) -> str:
-    """Send a chat completion request to Phi-4-multimodal-instruct."""
+def _retry_after_seconds(response: requests.Response, attempt: int) -> float:
+    """
+    Seconds to wait before retrying a throttled request.
+
+    Honors a Retry-After header given either as seconds or as an HTTP-date,
+    and falls back to exponential backoff when the header is missing.
+    """
+    value = response.headers.get("Retry-After")
+    if value:
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            try:
+                when = parsedate_to_datetime(value)
+                return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+            except (TypeError, ValueError):
+                pass
+    return float(2 ** attempt)
+
+
+def _post_with_backoff(endpoint: str, **kwargs) -> requests.Response:
+    """POST through the shared session, sleeping and retrying on HTTP 429."""
+    waited = 0.0
+    for attempt in range(_MAX_ATTEMPTS):
+        response = _SESSION.post(endpoint, **kwargs)
+        if response.status_code != 429 or attempt == _MAX_ATTEMPTS - 1:
+            break
+        delay = _retry_after_seconds(response, attempt)
+        response.close()
+        waited += delay
+        print(f"  Rate limited (429) — retrying in {delay:.1f}s "
+              f"(attempt {attempt + 1}/{_MAX_ATTEMPTS}, waited {waited:.1f}s total)")
+        time.sleep(delay)
+
+    if waited:
+        print(f"  Total backoff wait: {waited:.1f}s")
+    return response
+
+
+def call_phi4(endpoint: str, key: str, system_prompt: str, user_prompt: str,
+              echo: bool = True, response_format: dict | None = None,
+              max_tokens: int = 2048) -> str:
+    """
+    Send a chat completion request to Phi-4-multimodal-instruct.
+
+    The reply is streamed as Server-Sent Events and, when ``echo`` is set,
+    written to stdout as each delta arrives; the full text is returned
+    once the stream ends. ``response_format`` is passed through as-is,
+    e.g. {"type": "json_object"}; ``max_tokens`` caps the reply length.
+    """
 
     headers = {
         "Content-Type": "application/json",
@@ -105,18 +302,46 @@ def call_phi4(endpoint: str, key: str, system_prompt: str, user_prompt: str) ->
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": user_prompt},
         ],
-        "max_tokens": 2048,
+        "max_tokens": max_tokens,
         "temperature": 0.3,
+        "stream": True,
     }
+    if response_format:
+        payload["response_format"] = response_format
+
+    # orjson encodes straight to bytes; the Content-Type header is set above
+    body = orjson.dumps(payload)
+
+    parts = []
+    # (connect, read) — no read timeout, long answers keep the stream open
+    with _post_with_backoff(endpoint, headers=headers, data=body,
+                            stream=True, timeout=(10, None)) as response:
+        if not response.ok:
+            print(f"  ERROR {response.status_code}: {response.text}")
+        response.raise_for_status()
+
+        # Raw bytes: without a charset requests would decode the stream as
+        # ISO-8859-1, while orjson reads the bytes as UTF-8 directly
+        for line in response.iter_lines():
+            # Only data lines carry chunks; skip keep-alive blank lines,
+            # SSE comments (": ping") and event:/id:/retry: fields
+            if not line.startswith(b"data:"):
+                continue
+            line = line[len(b"data:"):].strip()
+            if line == b"[DONE]":
+                break
 
-    response = requests.post(endpoint, headers=headers, json=payload, timeout=120)
-
-    if not response.ok:
-        print(f"  ERROR {response.status_code}: {response.text}")
-    response.raise_for_status()
+            chunk = orjson.loads(line)
+            if not chunk.get("choices"):
+                continue
+            delta = chunk["choices"][0].get("delta", {}).get("content") or ""
+            if delta:
+                if echo:
+                    sys.stdout.write(delta)
+                    sys.stdout.flush()
+                parts.append(delta)
 
-    data = response.json()
-    return data["choices"][0]["message"]["content"]
+    return "".join(parts)
 
 
 # ────────────────────────────────────────────────────────────
@@ -130,51 +355,379 @@ SYSTEM_PROMPT = (
 )
 
 
+# Prompt scaffolding is stored once as a format string; only the
+# document-specific slots are substituted per call.
+_DOCUMENT_BODY = (
+    "**Document text:**\n{paragraphs}\n\n"
+    "**Tables:**\n{tables}\n\n"
+    "**Selection marks:** {selection_marks}\n\n"
+)
+
+_DOCUMENT_SECTIONS = (
+    "Below is the structured content extracted from a document.\n\n"
+    + _DOCUMENT_BODY
+)
+
+_SUMMARIZE_TMPL = (
+    _DOCUMENT_SECTIONS +
+    "Please provide:\n"
+    "1. A concise summary of the document (2-3 paragraphs).\n"
+    "2. Key data points or figures mentioned.\n"
+    "3. Any action items or important dates.\n"
+).format_map
+
+_QUESTION_TMPL = (
+    _DOCUMENT_SECTIONS +
+    "**Question:** {question}\n\n"
+    "Answer the question based only on the document content above. "
+    "If the answer is not in the document, say so."
+).format_map
+
+
+# Upper bound on document text packed into one batched Phi-4 request
+MAX_BATCH_CHARS = 60_000
+
+# Upper bound on documents per batch, and the reply budget each one gets,
+# so the combined JSON reply is not cut off at max_tokens
+MAX_BATCH_DOCS = 8
+REPLY_TOKENS_PER_DOC = 400
+
+_BATCH_TMPL = (
+    "Below are {count} documents, each extracted with Azure Document "
+    "Intelligence and numbered [1]..[{count}].\n\n"
+    "{documents}\n\n"
+    "{task}\n\n"
+    "Respond with a JSON object of the form "
+    '{{"documents": [{{"doc": <number>, "{field}": <text>}}, ...]}}, '
+    "with one entry per document, in order."
+).format_map
+
+_BATCH_SUMMARY_TASK = (
+    "For each document, write a concise summary (1-2 paragraphs) that "
+    "includes key data points, action items, and important dates."
+)
+
+
 def build_summarize_prompt(extracted: dict) -> str:
-    return (
-        "Below is the structured content extracted from a document.\n\n"
-        f"**Document text:**\n{extracted['paragraphs']}\n\n"
-        f"**Tables:**\n{extracted['tables']}\n\n"
-        f"**Selection marks:** {extracted['selection_marks']}\n\n"
-        "Please provide:\n"
-        "1. A concise summary of the document (2-3 paragraphs).\n"
-        "2. Key data points or figures mentioned.\n"
-        "3. Any action items or important dates.\n"
-    )
+    return _SUMMARIZE_TMPL(extracted)
 
 
 def build_question_prompt(extracted: dict, question: str) -> str:
-    return (
-        "Below is the structured content extracted from a document.\n\n"
-        f"**Document text:**\n{extracted['paragraphs']}\n\n"
-        f"**Tables:**\n{extracted['tables']}\n\n"
-        f"**Selection marks:** {extracted['selection_marks']}\n\n"
-        f"**Question:** {question}\n\n"
-        "Answer the question based only on the document content above. "
-        "If the answer is not in the document, say so."
+    return _QUESTION_TMPL(ChainMap({"question": question}, extracted))
+
+
+def build_batch_prompt(docs: list[tuple[int, dict]],
+                       question: str | None = None) -> str:
+    """Pack several extracted documents into one numbered Phi-4 prompt."""
+    documents = "\n\n".join(
+        f"[{num}]\n" + _DOCUMENT_BODY.format_map(extracted).rstrip()
+        for num, extracted in docs
     )
+    if question:
+        task = (f"Answer this question for each document, based only on "
+                f"its content (say so if it is not there): {question}")
+        field = "answer"
+    else:
+        task = _BATCH_SUMMARY_TASK
+        field = "summary"
+    return _BATCH_TMPL({
+        "count": len(docs), "documents": documents,
+        "task": task, "field": field,
+    })
+
+
+def plan_batches(extracted_docs: list[dict],
+                 max_chars: int = MAX_BATCH_CHARS,
+                 max_docs: int = MAX_BATCH_DOCS) -> list[list[int]]:
+    """
+    Group document indexes into batches whose text stays under max_chars
+    and that hold at most max_docs documents.
+
+    A document larger than the limit gets a batch of its own.
+    """
+    batches, current, size = [], [], 0
+    for idx, extracted in enumerate(extracted_docs):
+        doc_size = (len(extracted["paragraphs"]) + len(extracted["tables"])
+                    + len(extracted["selection_marks"]))
+        if current and (size + doc_size > max_chars
+                        or len(current) >= max_docs):
+            batches.append(current)
+            current, size = [], 0
+        current.append(idx)
+        size += doc_size
+    if current:
+        batches.append(current)
+    return batches
 
 
 # ────────────────────────────────────────────────────────────
 # 4.  MAIN
 # ────────────────────────────────────────────────────────────
 
+def print_extraction(extracted: dict):
+    """Print the Document Intelligence extraction stats."""
+    print(f"  ✓ Extracted {extracted['page_count']} page(s)")
+    print(f"    Model: {extracted['model_id']}")
+    print(f"    Paragraphs: {len(extracted['paragraphs'].splitlines())} lines")
+    if extracted["tables"] == NOT_EXTRACTED:
+        tables_count = NOT_EXTRACTED
+    else:
+        tables_count = extracted["tables"].count("### Table")
+    print(f"    Tables: {tables_count}")
+    print(f"    Selection marks: {extracted['selection_marks']}")
+
+
+def analyze_file(file_path: str, di_client: DocumentIntelligenceClient,
+                 phi4_endpoint: str, phi4_key: str,
+                 question: str | None = None,
+                 layout_opts: dict | None = None) -> tuple[dict, str]:
+    """
+    Extract one document and analyze it with Phi-4.
+
+    ``layout_opts`` are passed through to extract_layout_text(). Safe to run
+    from worker threads: the DI client and the HTTP session are shared, and
+    the Phi-4 reply is collected rather than streamed to stdout.
+    """
+    extracted = extract_layout_text(file_path, None, None, client=di_client,
+                                    **(layout_opts or {}))
+    if question:
+        prompt = build_question_prompt(extracted, question)
+    else:
+        prompt = build_summarize_prompt(extracted)
+    answer = call_phi4(phi4_endpoint, phi4_key, SYSTEM_PROMPT, prompt, echo=False)
+    return extracted, answer
+
+
+def expand_files(files: list[str], patterns: list[str] | None) -> list[str]:
+    """Collect the positional files and any --files glob matches, in order."""
+    paths = list(files)
+    for pattern in patterns or []:
+        matches = sorted(glob.glob(pattern))
+        paths.extend(matches if matches else [pattern])
+    # Drop duplicates while keeping the first occurrence
+    return list(dict.fromkeys(paths))
+
+
+def run_single(file_path, di_client, phi4_endpoint, phi4_key, question, mode,
+               layout_opts):
+    """Process one document, streaming the Phi-4 answer as it arrives."""
+
+    # ── Step 1: Extract with Document Intelligence ──
+    print("=" * 60)
+    print("  STEP 1 — Extracting document with Document Intelligence")
+    print("=" * 60)
+    print(f"  File: {file_path}\n")
+
+    extracted = extract_layout_text(file_path, None, None, client=di_client,
+                                    **layout_opts)
+    print_extraction(extracted)
+
+    # ── Step 2: Analyze with Phi-4 ──
+    print()
+    print("=" * 60)
+    print(f"  STEP 2 — {mode} with Phi-4-multimodal-instruct")
+    print("=" * 60)
+
+    if question:
+        prompt = build_question_prompt(extracted, question)
+    else:
+        prompt = build_summarize_prompt(extracted)
+
+    print("  Sending to Phi-4 …")
+    print()
+    print("-" * 60)
+    print(f"  PHI-4 {mode.upper()}")
+    print("-" * 60)
+    print()
+
+    # The answer is streamed to stdout as it is generated
+    call_phi4(phi4_endpoint, phi4_key, SYSTEM_PROMPT, prompt)
+    print()
+    print()
+
+
+def run_many(paths, di_client, phi4_endpoint, phi4_key, question, mode,
+             concurrency, layout_opts):
+    """Process several documents concurrently, printing each as it finishes."""
+    print("=" * 60)
+    print(f"  {mode.upper()} — {len(paths)} documents "
+          f"(up to {concurrency} at a time)")
+    print("=" * 60)
+    print()
+
+    failures = 0
+    with ThreadPoolExecutor(max_workers=min(concurrency, len(paths))) as pool:
+        futures = {
+            pool.submit(analyze_file, path, di_client,
+                        phi4_endpoint, phi4_key, question, layout_opts): path
+            for path in paths
+        }
+        for future in as_completed(futures):
+            path = futures[future]
+            print("-" * 60)
+            print(f"  {path}")
+            print("-" * 60)
+            try:
+                extracted, answer = future.result()
+            except Exception as exc:
+                failures += 1
+                print(f"  ERROR: {exc}\n")
+                continue
+            print_extraction(extracted)
+            print()
+            print(answer)
+            print()
+
+    print(f"--- SUMMARY ---\n")
+    print(f"  Documents: {len(paths)}")
+    print(f"  Failed:    {failures}")
+    if failures:
+        sys.exit(1)
+
+
+def run_batch(paths, di_client, phi4_endpoint, phi4_key, question, mode,
+              concurrency, layout_opts):
+    """
+    Extract documents concurrently, then analyze them with as few Phi-4
+    requests as possible by packing several documents into each prompt.
+    """
+    print("=" * 60)
+    print(f"  BATCH {mode.upper()} — {len(paths)} documents")
+    print("=" * 60)
+    print()
+
+    # Extract every document; a failed one is reported and left out
+    failures = 0
+    ok_paths = []
+    extracted_docs = []
+    with ThreadPoolExecutor(max_workers=min(concurrency, len(paths))) as pool:
+        futures = [
+            pool.submit(extract_layout_text, path, None, None,
+                        client=di_client, **layout_opts)
+            for path in paths
+        ]
+        for path, future in zip(paths, futures):
+            try:
+                extracted = future.result()
+            except Exception as exc:
+                failures += 1
+                print(f"  ERROR: {path}: {exc}\n")
+                continue
+            ok_paths.append(path)
+            extracted_docs.append(extracted)
+
+    batches = plan_batches(extracted_docs)
+    field = "answer" if question else "summary"
+    print(f"  Sending {len(extracted_docs)} documents to Phi-4 in "
+          f"{len(batches)} request(s) …\n")
+
+    # JSON mode is requested, but the prompt spells out the same JSON shape,
+    # so an endpoint that rejects response_format still gets a usable prompt
+    response_format = {"type": "json_object"}
+    for batch in batches:
+        prompt = build_batch_prompt(
+            [(num, extracted_docs[idx]) for num, idx in enumerate(batch, 1)],
+            question,
+        )
+        max_tokens = max(2048, REPLY_TOKENS_PER_DOC * len(batch))
+        try:
+            try:
+                reply = call_phi4(phi4_endpoint, phi4_key, SYSTEM_PROMPT,
+                                  prompt, echo=False,
+                                  response_format=response_format,
+                                  max_tokens=max_tokens)
+            except requests.HTTPError as exc:
+                if response_format is None or exc.response.status_code not in (400, 422):
+                    raise
+                print("  Phi-4 endpoint rejected response_format; "
+                      "retrying without JSON mode.\n")
+                response_format = None
+                reply = call_phi4(phi4_endpoint, phi4_key, SYSTEM_PROMPT,
+                                  prompt, echo=False, max_tokens=max_tokens)
+        except Exception as exc:
+            failures += len(batch)
+            print(f"  ERROR: Phi-4 request failed for "
+                  f"{len(batch)} document(s): {exc}\n")
+            continue
+        try:
+            entries = {int(e["doc"]): e.get(field, "")
+                       for e in orjson.loads(reply)["documents"]}
+        except (ValueError, KeyError, TypeError):
+            failures += len(batch)
+            print("  ERROR: Phi-4 did not return the expected JSON; raw reply:\n")
+            print(reply)
+            print()
+            continue
+
+        for num, idx in enumerate(batch, 1):
+            print("-" * 60)
+            print(f"  {ok_paths[idx]}")
+            print("-" * 60)
+            print_extraction(extracted_docs[idx])
+            print()
+            print(entries.get(num, "(no entry returned for this document)"))
+            print()
+
+    print(f"--- SUMMARY ---\n")
+    print(f"  Documents: {len(paths)}")
+    print(f"  Failed:    {failures}")
+    if failures:
+        sys.exit(1)
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="Extract a document with Document Intelligence, "
                     "then analyze it with Phi-4-multimodal-instruct.",
     )
-    parser.add_argument("file", help="Path to the PDF or image to analyze.")
+    parser.add_argument("file", nargs="*",
+                        help="Path(s) to the PDF or image to analyze.")
+    parser.add_argument(
+        "--files", nargs="+", metavar="PATTERN",
+        help="One or more files or glob patterns to analyze concurrently.",
+    )
+    parser.add_argument(
+        "--concurrency", "-c", type=int, default=4,
+        help="Maximum number of documents processed at once (default: 4).",
+    )
+    parser.add_argument(
+        "--batch", action="store_true",
+        help="Send several documents to Phi-4 in one request and get a "
+             "per-document JSON reply (fewer, larger requests).",
+    )
     parser.add_argument(
         "--question", "-q",
         help="Ask a specific question about the document. "
              "If omitted, the script produces a summary.",
     )
+    parser.add_argument(
+        "--no-cache", action="store_true",
+        help="Ignore cached layout results and re-analyze the document.",
+    )
+    parser.add_argument(
+        "--pages",
+        help='Only analyze these pages, e.g. "1-5" or "1,3,7-9".',
+    )
+    parser.add_argument(
+        "--no-tables", action="store_true",
+        help="Leave tables out of the text sent to Phi-4.",
+    )
+    parser.add_argument(
+        "--no-selection-marks", action="store_true",
+        help="Leave checkboxes out of the text sent to Phi-4.",
+    )
     args = parser.parse_args()
 
-    if not os.path.exists(args.file):
-        print(f"ERROR: File not found: {args.file}")
-        sys.exit(1)
+    paths = expand_files(args.file, args.files)
+    if not paths:
+        parser.error("Provide a file path or --files PATTERN.")
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1.")
+
+    for path in paths:
+        if not os.path.exists(path):
+            print(f"ERROR: File not found: {path}")
+            sys.exit(1)
 
     # Load credentials
     load_dotenv()
@@ -190,43 +743,28 @@ def main():
         print("ERROR: Missing Phi-4 credentials in .env")
         sys.exit(1)
 
-    # ── Step 1: Extract with Document Intelligence ──
-    print("=" * 60)
-    print("  STEP 1 — Extracting document with Document Intelligence")
-    print("=" * 60)
-    print(f"  File: {args.file}\n")
-
-    extracted = extract_layout_text(args.file, di_endpoint, di_key)
-
-    print(f"  ✓ Extracted {extracted['page_count']} page(s)")
-    print(f"    Model: {extracted['model_id']}")
-    print(f"    Paragraphs: {len(extracted['paragraphs'].splitlines())} lines")
-    tables_count = extracted["tables"].count("### Table") if extracted["tables"] else 0
-    print(f"    Tables: {tables_count}")
-    print(f"    Selection marks: {extracted['selection_marks']}")
-
-    # ── Step 2: Analyze with Phi-4 ──
     mode = "Question" if args.question else "Summary"
-    print()
-    print("=" * 60)
-    print(f"  STEP 2 — {mode} with Phi-4-multimodal-instruct")
-    print("=" * 60)
-
-    if args.question:
-        prompt = build_question_prompt(extracted, args.question)
-    else:
-        prompt = build_summarize_prompt(extracted)
-
-    print("  Sending to Phi-4 …")
-    answer = call_phi4(phi4_endpoint, phi4_key, SYSTEM_PROMPT, prompt)
+    layout_opts = {
+        "use_cache": not args.no_cache,
+        "pages": args.pages,
+        "tables": not args.no_tables,
+        "selection_marks": not args.no_selection_marks,
+    }
 
-    print()
-    print("-" * 60)
-    print(f"  PHI-4 {mode.upper()}")
-    print("-" * 60)
-    print()
-    print(answer)
-    print()
+    di_client = DocumentIntelligenceClient(
+        endpoint=di_endpoint,
+        credential=AzureKeyCredential(di_key),
+    )
+    with di_client:
+        if args.batch:
+            run_batch(paths, di_client, phi4_endpoint, phi4_key,
+                      args.question, mode, args.concurrency, layout_opts)
+        elif len(paths) == 1:
+            run_single(paths[0], di_client, phi4_endpoint, phi4_key,
+                       args.question, mode, layout_opts)
+        else:
+            run_many(paths, di_client, phi4_endpoint, phi4_key,
+                     args.question, mode, args.concurrency, layout_opts)
 
 
 if __name__ == "__main__":
@@ -1,5 +1,6 @@
 import os
 import sys
+from collections import Counter
 from dotenv import load_dotenv
 from azure.core.credentials import AzureKeyCredential
 from azure.ai.documentintelligence import DocumentIntelligenceClient
@@ -64,11 +65,21 @@ def main():
     # ============================================================
     print("--- CLASSIFICATION RESULTS ---\n")
 
+    # Summary stats are gathered in the same pass as the per-document output
+    type_counts = Counter()
+    conf_sum = 0.0
+    conf_n = 0
+
     if result.documents:
         for idx, document in enumerate(result.documents, start=1):
             doc_type = document.doc_type if document.doc_type else "Unknown"
             confidence = document.confidence if document.confidence else 0.0
 
+            type_counts[doc_type] += 1
+            if document.confidence:
+                conf_sum += document.confidence
+                conf_n += 1
+
             # Confidence bar for visual clarity
             bar_length = int(confidence * 30)
             bar = "█" * bar_length + "░" * (30 - bar_length)
@@ -101,22 +112,13 @@ def main():
     print(f"  Classifier:       {classifier_id}")
     print(f"  Documents found:  {len(result.documents) if result.documents else 0}")
 
-    if result.documents:
-        # Group by document type
-        type_counts = {}
-        for doc in result.documents:
-            doc_type = doc.doc_type or "Unknown"
-            type_counts[doc_type] = type_counts.get(doc_type, 0) + 1
-
+    if type_counts:
         print(f"  Document types:")
-        for doc_type, count in sorted(type_counts.items()):
+        for doc_type, count in type_counts.most_common():
             print(f"    - {doc_type}: {count}")
 
-        # Average confidence
-        confidences = [d.confidence for d in result.documents if d.confidence]
-        if confidences:
-            avg_confidence = sum(confidences) / len(confidences)
-            print(f"  Avg confidence:   {avg_confidence:.2%}")
+        if conf_n:
+            print(f"  Avg confidence:   {conf_sum / conf_n:.2%}")
 
     print(f"  Model:            {result.model_id} (API {result.api_version})")
 
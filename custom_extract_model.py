@@ -1,18 +1,57 @@
+import io
 import os
+import re
 import sys
 import argparse
 from datetime import datetime
-from dotenv import load_dotenv
-from azure.core.credentials import AzureKeyCredential
-from azure.ai.documentintelligence import (
-    DocumentIntelligenceClient,
-    DocumentIntelligenceAdministrationClient,
-)
-from azure.ai.documentintelligence.models import (
-    BuildDocumentModelRequest,
-    AzureBlobContentSource,
-    DocumentBuildMode,
-)
+from concurrent.futures import ThreadPoolExecutor
+
+# The Azure SDK and python-dotenv are imported inside the functions that
+# need them, so `--help` and argument errors don't pay their import cost.
+
+
+# Field categories for organized output in analyze mode
+_CATEGORIES = {
+    "Document Metadata": [
+        "DocumentNumber", "Revision", "EffectiveDate", "Function",
+        "Title", "Date", "Rev",
+    ],
+    "Member Applicability": [
+        "MemberName", "Abbreviation", "ChapterApplicability",
+        "Member", "Applicability",
+    ],
+    "Supplier Forms": [
+        "FormNumber", "FormName", "SupplierForm",
+    ],
+}
+
+# Lower-cased keywords, computed once for case-insensitive matching
+_CATEGORIES_LC = {
+    cat: tuple(kw.lower() for kw in keywords)
+    for cat, keywords in _CATEGORIES.items()
+}
+
+# All keywords compiled into one pattern, so a field name is scanned once
+# rather than once per keyword. The zero-width lookahead reports a match at
+# every position where some keyword starts (overlaps included), tagged with
+# its category's group; categories are tried in priority order.
+_CATEGORY_NAMES = list(_CATEGORIES_LC)
+_CATEGORY_RE = re.compile("(?=" + "|".join(
+    f"(?P<c{i}>" + "|".join(map(re.escape, keywords)) + ")"
+    for i, keywords in enumerate(_CATEGORIES_LC.values())
+) + ")")
+
+
+def categorize_field(field_name):
+    """Return the first category whose keywords occur in the name, or None."""
+    best = None
+    for m in _CATEGORY_RE.finditer(field_name.lower()):
+        idx = int(m.lastgroup[1:])
+        if best is None or idx < best:
+            best = idx
+            if idx == 0:
+                break
+    return None if best is None else _CATEGORY_NAMES[best]
 
 
 def print_banner(mode):
@@ -42,21 +81,35 @@ def print_banner(mode):
     print("=" * 60)
 
 
+# (endpoint, key) once load_credentials() has run
+_CREDS = None
+
+
 def load_credentials():
-    """Load and validate Azure credentials from .env."""
+    """Load and validate Azure credentials from .env (once per process)."""
+    global _CREDS
+    if _CREDS:
+        return _CREDS
+
+    from dotenv import load_dotenv
+
     load_dotenv()
-    endpoint = os.getenv("AZURE_DOCUMENT_INTELLIGENCE_ENDPOINT")
-    key = os.getenv("AZURE_DOCUMENT_INTELLIGENCE_KEY")
+    endpoint = os.environ.get("AZURE_DOCUMENT_INTELLIGENCE_ENDPOINT")
+    key = os.environ.get("AZURE_DOCUMENT_INTELLIGENCE_KEY")
 
     if not endpoint or not key:
         print("ERROR: Missing credentials in .env file.")
         exit(1)
 
-    return endpoint, key
+    _CREDS = (endpoint, key)
+    return _CREDS
 
 
 def get_admin_client(endpoint, key):
     """Create an administration client for model management."""
+    from azure.core.credentials import AzureKeyCredential
+    from azure.ai.documentintelligence import DocumentIntelligenceAdministrationClient
+
     return DocumentIntelligenceAdministrationClient(
         endpoint=endpoint, credential=AzureKeyCredential(key)
     )
@@ -64,11 +117,36 @@ def get_admin_client(endpoint, key):
 
 def get_analyze_client(endpoint, key):
     """Create a client for document analysis."""
+    from azure.core.credentials import AzureKeyCredential
+    from azure.ai.documentintelligence import DocumentIntelligenceClient
+
     return DocumentIntelligenceClient(
         endpoint=endpoint, credential=AzureKeyCredential(key)
     )
 
 
+# Indentation strings by width, shared across print_field calls
+_PREFIXES = {}
+
+
+def iter_schema(schema):
+    """
+    Yield (name, type, description) for each field in a doc type's schema.
+
+    Schemas are either all plain dicts or all model objects, so the
+    accessor is picked once from the first entry instead of per field.
+    """
+    if not schema:
+        return
+    probe = next(iter(schema.values()))
+    if isinstance(probe, dict):
+        for name, info in schema.items():
+            yield name, info.get("type", "unknown"), info.get("description")
+    else:
+        for name, info in schema.items():
+            yield name, getattr(info, "type", "unknown"), None
+
+
 # ================================================================
 # --train mode
 # ================================================================
@@ -102,6 +180,12 @@ def do_train(endpoint, key):
     print("\n--- TRAINING ---\n")
     print("  Starting model build (neural models can take 10-30+ minutes)...\n")
 
+    from azure.ai.documentintelligence.models import (
+        BuildDocumentModelRequest,
+        AzureBlobContentSource,
+        DocumentBuildMode,
+    )
+
     admin_client = get_admin_client(endpoint, key)
 
     poller = admin_client.begin_build_document_model(
@@ -128,8 +212,7 @@ def do_train(endpoint, key):
             print(f"\n  Document type: {doc_type_name}")
             if doc_type.field_schema:
                 print(f"  Fields ({len(doc_type.field_schema)}):")
-                for field_name, field_info in doc_type.field_schema.items():
-                    field_type = field_info.get("type", "unknown") if isinstance(field_info, dict) else getattr(field_info, "type", "unknown")
+                for field_name, field_type, _ in iter_schema(doc_type.field_schema):
                     print(f"    - {field_name} ({field_type})")
 
     print(f"\n--- NEXT STEP ---\n")
@@ -164,20 +247,8 @@ def do_analyze(endpoint, key, file_path):
         poller = client.begin_analyze_document(model_id, body=document_file)
     result = poller.result()
 
-    # Field categories for organized output
-    categories = {
-        "Document Metadata": [
-            "DocumentNumber", "Revision", "EffectiveDate", "Function",
-            "Title", "Date", "Rev",
-        ],
-        "Member Applicability": [
-            "MemberName", "Abbreviation", "ChapterApplicability",
-            "Member", "Applicability",
-        ],
-        "Supplier Forms": [
-            "FormNumber", "FormName", "SupplierForm",
-        ],
-    }
+    # Output is collected in memory and written once at the end
+    out = io.StringIO()
 
     # ============================================================
     # EXTRACTED DOCUMENTS
@@ -185,42 +256,39 @@ def do_analyze(endpoint, key, file_path):
     if result.documents:
         for doc_idx, document in enumerate(result.documents):
             print(f"--- DOCUMENT {doc_idx + 1} (type: {document.doc_type}, "
-                  f"confidence: {document.confidence:.0%}) ---\n")
+                  f"confidence: {document.confidence:.0%}) ---\n", file=out)
 
             if not document.fields:
-                print("  No fields extracted.\n")
+                print("  No fields extracted.\n", file=out)
                 continue
 
             # Group fields by category
-            categorized = {cat: {} for cat in categories}
+            categorized = {cat: {} for cat in _CATEGORIES}
             uncategorized = {}
 
             for field_name, field in document.fields.items():
-                placed = False
-                for cat, keywords in categories.items():
-                    if any(kw.lower() in field_name.lower() for kw in keywords):
-                        categorized[cat][field_name] = field
-                        placed = True
-                        break
-                if not placed:
+                cat = categorize_field(field_name)
+                if cat:
+                    categorized[cat][field_name] = field
+                else:
                     uncategorized[field_name] = field
 
             # Print each category
             for cat, fields in categorized.items():
                 if not fields:
                     continue
-                print(f"  [{cat}]")
+                print(f"  [{cat}]", file=out)
                 for field_name, field in fields.items():
-                    print_field(field_name, field, indent=4)
-                print()
+                    print_field(field_name, field, indent=4, out=out)
+                print(file=out)
 
             if uncategorized:
-                print("  [Other Fields]")
+                print("  [Other Fields]", file=out)
                 for field_name, field in uncategorized.items():
-                    print_field(field_name, field, indent=4)
-                print()
+                    print_field(field_name, field, indent=4, out=out)
+                print(file=out)
     else:
-        print("  No documents extracted. The model may not match this document.\n")
+        print("  No documents extracted. The model may not match this document.\n", file=out)
 
     # ============================================================
     # SUMMARY
@@ -231,34 +299,58 @@ def do_analyze(endpoint, key, file_path):
             if doc.fields:
                 total_fields += len(doc.fields)
 
-    print("--- SUMMARY ---\n")
-    print(f"  Documents:   {len(result.documents) if result.documents else 0}")
-    print(f"  Fields:      {total_fields}")
-    print(f"  Model:       {model_id} (API {result.api_version})")
-
-
-def print_field(name, field, indent=4):
-    """Print a single extracted field with confidence."""
-    prefix = " " * indent
-    confidence = field.confidence if field.confidence else 0
-
-    if field.type == "array" and field.value_array:
-        print(f"{prefix}{name}: (list, {len(field.value_array)} items, {confidence:.0%})")
-        for i, item in enumerate(field.value_array):
-            if item.type == "object" and item.value_object:
-                print(f"{prefix}  [{i + 1}]")
-                for sub_name, sub_field in item.value_object.items():
-                    print_field(sub_name, sub_field, indent=indent + 6)
-            else:
-                val = item.content if item.content else "(empty)"
-                print(f"{prefix}  [{i + 1}] {val}")
-    elif field.type == "object" and field.value_object:
-        print(f"{prefix}{name}: (object, {confidence:.0%})")
-        for sub_name, sub_field in field.value_object.items():
-            print_field(sub_name, sub_field, indent=indent + 2)
-    else:
-        val = field.content if field.content else field.value_string if field.value_string else "(empty)"
-        print(f"{prefix}{name}: {val}  ({confidence:.0%})")
+    print("--- SUMMARY ---\n", file=out)
+    print(f"  Documents:   {len(result.documents) if result.documents else 0}", file=out)
+    print(f"  Fields:      {total_fields}", file=out)
+    print(f"  Model:       {model_id} (API {result.api_version})", file=out)
+
+    sys.stdout.write(out.getvalue())
+    sys.stdout.flush()
+
+
+def print_field(name, field, indent=4, out=None):
+    """
+    Print a single extracted field with confidence to ``out`` (stdout by default).
+
+    Nested arrays/objects are walked with an explicit stack rather than by
+    recursion, so deeply nested fields cost no extra Python call frames.
+    Entries are either ("field", name, field, indent) or ("line", text);
+    children are pushed in reverse so they pop in document order.
+    """
+    if out is None:
+        out = sys.stdout
+    stack = [("field", name, field, indent)]
+
+    while stack:
+        entry = stack.pop()
+        if entry[0] == "line":
+            print(entry[1], file=out)
+            continue
+
+        _, name, field, indent = entry
+        prefix = _PREFIXES.get(indent)
+        if prefix is None:
+            prefix = _PREFIXES[indent] = " " * indent
+        confidence = field.confidence if field.confidence else 0
+
+        if field.type == "array" and field.value_array:
+            print(f"{prefix}{name}: (list, {len(field.value_array)} items, {confidence:.0%})", file=out)
+            for i in range(len(field.value_array) - 1, -1, -1):
+                item = field.value_array[i]
+                if item.type == "object" and item.value_object:
+                    for sub_name, sub_field in reversed(item.value_object.items()):
+                        stack.append(("field", sub_name, sub_field, indent + 6))
+                    stack.append(("line", f"{prefix}  [{i + 1}]"))
+                else:
+                    val = item.content if item.content else "(empty)"
+                    stack.append(("line", f"{prefix}  [{i + 1}] {val}"))
+        elif field.type == "object" and field.value_object:
+            print(f"{prefix}{name}: (object, {confidence:.0%})", file=out)
+            for sub_name, sub_field in reversed(field.value_object.items()):
+                stack.append(("field", sub_name, sub_field, indent + 2))
+        else:
+            val = field.content if field.content else field.value_string if field.value_string else "(empty)"
+            print(f"{prefix}{name}: {val}  ({confidence:.0%})", file=out)
 
 
 # ================================================================
@@ -278,51 +370,64 @@ def do_info(endpoint, key):
     admin_client = get_admin_client(endpoint, key)
     model = admin_client.get_model(model_id)
 
-    print("--- MODEL DETAILS ---\n")
-    print(f"  Model ID:    {model.model_id}")
-    print(f"  Status:      {model.status if hasattr(model, 'status') else 'N/A'}")
-    print(f"  Created:     {model.created_date_time}")
-    print(f"  API version: {model.api_version}")
-    print(f"  Description: {model.description or '(none)'}")
+    # Output is collected in memory and written once at the end
+    out = io.StringIO()
+
+    print("--- MODEL DETAILS ---\n", file=out)
+    print(f"  Model ID:    {model.model_id}", file=out)
+    print(f"  Status:      {model.status if hasattr(model, 'status') else 'N/A'}", file=out)
+    print(f"  Created:     {model.created_date_time}", file=out)
+    print(f"  API version: {model.api_version}", file=out)
+    print(f"  Description: {model.description or '(none)'}", file=out)
 
     if model.doc_types:
-        print(f"\n--- DOCUMENT TYPES ({len(model.doc_types)}) ---\n")
+        print(f"\n--- DOCUMENT TYPES ({len(model.doc_types)}) ---\n", file=out)
         for doc_type_name, doc_type in model.doc_types.items():
-            print(f"  Type: {doc_type_name}")
+            print(f"  Type: {doc_type_name}", file=out)
             if doc_type.field_schema:
-                print(f"  Fields ({len(doc_type.field_schema)}):")
-                for field_name, field_info in doc_type.field_schema.items():
-                    field_type = field_info.get("type", "unknown") if isinstance(field_info, dict) else getattr(field_info, "type", "unknown")
-                    desc = ""
-                    if isinstance(field_info, dict) and field_info.get("description"):
-                        desc = f" — {field_info['description']}"
-                    print(f"    - {field_name} ({field_type}){desc}")
+                print(f"  Fields ({len(doc_type.field_schema)}):", file=out)
+                for field_name, field_type, description in iter_schema(doc_type.field_schema):
+                    desc = f" — {description}" if description else ""
+                    print(f"    - {field_name} ({field_type}){desc}", file=out)
             if doc_type.field_confidence:
-                print(f"  Field confidence:")
+                print(f"  Field confidence:", file=out)
                 for field_name, conf in doc_type.field_confidence.items():
-                    print(f"    - {field_name}: {conf:.0%}")
-            print()
+                    print(f"    - {field_name}: {conf:.0%}", file=out)
+            print(file=out)
     else:
-        print("\n  No document types defined.\n")
+        print("\n  No document types defined.\n", file=out)
+
+    sys.stdout.write(out.getvalue())
+    sys.stdout.flush()
 
 
 # ================================================================
 # --list mode
 # ================================================================
-def do_list(endpoint, key):
-    """List all custom (non-prebuilt) models in the resource."""
+def do_list(endpoint, key, verbose=False):
+    """
+    List all custom (non-prebuilt) models in the resource.
+
+    With ``verbose``, each model's full details are fetched as well. The
+    per-model GETs are independent, so they run on a small thread pool
+    sharing the one admin client (and its connection pool).
+    """
     print_banner("list")
     print()
 
     admin_client = get_admin_client(endpoint, key)
-    models = admin_client.list_models()
+    # Skip prebuilt models
+    models = [m for m in admin_client.list_models()
+              if not m.model_id.startswith("prebuilt-")]
+
+    if verbose and models:
+        with ThreadPoolExecutor(max_workers=min(8, len(models))) as pool:
+            models = list(pool.map(admin_client.get_model,
+                                   (m.model_id for m in models)))
 
     print("--- CUSTOM MODELS ---\n")
     count = 0
     for model in models:
-        # Skip prebuilt models
-        if model.model_id.startswith("prebuilt-"):
-            continue
         count += 1
         status = model.status if hasattr(model, "status") else "N/A"
         print(f"  {count}. {model.model_id}")
@@ -330,6 +435,11 @@ def do_list(endpoint, key):
         print(f"     Created: {model.created_date_time}")
         if model.description:
             print(f"     Desc:    {model.description}")
+        if verbose:
+            print(f"     API:     {model.api_version}")
+            for doc_type_name, doc_type in (model.doc_types or {}).items():
+                n_fields = len(doc_type.field_schema) if doc_type.field_schema else 0
+                print(f"     Type:    {doc_type_name} ({n_fields} fields)")
         print()
 
     if count == 0:
@@ -355,8 +465,12 @@ def main():
                        help="Show details about the trained model")
     group.add_argument("--list", action="store_true",
                        help="List all custom models in the resource")
+    parser.add_argument("--verbose", "-v", action="store_true",
+                        help="With --list, fetch and show each model's doc types")
 
     args = parser.parse_args()
+    if args.verbose and not args.list:
+        parser.error("--verbose can only be used with --list.")
 
     endpoint, key = load_credentials()
 
@@ -365,7 +479,7 @@ def main():
     elif args.info:
         do_info(endpoint, key)
     elif args.list:
-        do_list(endpoint, key)
+        do_list(endpoint, key, verbose=args.verbose)
     else:
         if not args.file:
             parser.error("A PDF file path is required for analyze mode.\n"
@@ -0,0 +1,430 @@
+"""
+Shared helpers for the Document Intelligence scripts.
+"""
+
+import io
+import os
+import sys
+from importlib.util import find_spec
+from operator import itemgetter
+from concurrent.futures import ThreadPoolExecutor
+import orjson
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+from azure.core.credentials import AzureKeyCredential
+from azure.core.pipeline.transport import RequestsTransport
+from azure.ai.documentintelligence import DocumentIntelligenceClient
+from azure.ai.documentintelligence.models import (
+    AnalyzeDocumentRequest, AnalyzeResult, StringIndexType,
+)
+
+
+# Default number of documents analyzed at once
+DEFAULT_CONCURRENCY = min(os.cpu_count() or 1, 8)
+
+# Keep-alive connections held open per host by a client's session
+POOL_SIZE = 32
+
+
+def use_managed_identity() -> bool:
+    """True when AZURE_USE_MI=1 asks for Entra ID auth instead of a key."""
+    return os.getenv("AZURE_USE_MI") == "1"
+
+
+def load_credentials() -> tuple[str, str | None]:
+    """
+    Read the endpoint and key from the environment / .env, or exit.
+
+    The .env file is only parsed when the environment does not already
+    provide them. With AZURE_USE_MI=1 no key is needed and None is
+    returned in its place.
+    """
+    endpoint = os.getenv("AZURE_DOCUMENT_INTELLIGENCE_ENDPOINT")
+    key = os.getenv("AZURE_DOCUMENT_INTELLIGENCE_KEY")
+    if not endpoint or not (key or use_managed_identity()):
+        load_dotenv()
+        endpoint = os.getenv("AZURE_DOCUMENT_INTELLIGENCE_ENDPOINT")
+        key = os.getenv("AZURE_DOCUMENT_INTELLIGENCE_KEY")
+
+    managed_identity = use_managed_identity()
+    if not endpoint or not (key or managed_identity):
+        print("ERROR: Missing credentials in .env file.")
+        exit(1)
+    return endpoint, None if managed_identity else key
+
+
+def make_client(endpoint: str, key: str | None) -> DocumentIntelligenceClient:
+    """
+    Build a client whose transport keeps a pool of keep-alive connections.
+
+    Create it once and reuse it for every document: after the first
+    request, later ones (and the status polls behind each one) go out
+    over already-open TLS connections instead of handshaking again.
+    Retries are left to the SDK's own retry policy, so the adapter does
+    not add any of its own.
+
+    Without a key the client authenticates with DefaultAzureCredential
+    (managed identity, environment, Azure CLI, ...). Its bearer token is
+    cached by the client's pipeline and reused until it nears expiry.
+    """
+    if key:
+        credential = AzureKeyCredential(key)
+    else:
+        from azure.identity import DefaultAzureCredential
+        credential = DefaultAzureCredential(
+            exclude_interactive_browser_credential=True
+        )
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    transport = RequestsTransport(
+        session=session, session_owner=True, connection_timeout=60
+    )
+    return DocumentIntelligenceClient(
+        endpoint=endpoint, credential=credential, transport=transport,
+    )
+
+
+def is_url(source: str) -> bool:
+    """True if the source is an http(s) URL rather than a local path."""
+    return source.startswith(("https://", "http://"))
+
+
+def analyze_document(client, source: str, model_id: str, features=None,
+                     pages: str | None = None):
+    """
+    Run one analysis and wait for its result.
+
+    A URL is passed to the service to fetch itself, so nothing is uploaded.
+    A local file is handed over as an open file object, which the
+    transport streams from disk in blocks (and can rewind on retry)
+    rather than reading it into memory first. ``pages`` (e.g. "9-16")
+    limits the analysis to those pages; its spans are then counted in
+    Unicode code points, the units merge_results() shifts them by.
+    """
+    # The service's default textElements offsets count grapheme clusters,
+    # which differ from len() on accents, Indic scripts and emoji
+    string_index_type = StringIndexType.UNICODE_CODE_POINT if pages else None
+    if is_url(source):
+        poller = client.begin_analyze_document(
+            model_id, AnalyzeDocumentRequest(url_source=source),
+            features=features, pages=pages,
+            string_index_type=string_index_type,
+        )
+    else:
+        with open(source, "rb") as document_file:
+            poller = client.begin_analyze_document(
+                model_id, body=document_file, features=features, pages=pages,
+                string_index_type=string_index_type,
+            )
+    return poller.result()
+
+
+def page_ranges(source: str, pages_per_call: int | None) -> list:
+    """
+    Split a local PDF into page ranges ("1-8", ..., "17") of at most
+    ``pages_per_call`` pages. Returns [None] (the whole document in one
+    call) for URLs, other file types, short PDFs, when not splitting, or
+    when the pages cannot be counted (pypdf missing, an encrypted or
+    malformed PDF), since a single call can still analyze those.
+    """
+    if not pages_per_call or is_url(source) or not source.lower().endswith(".pdf"):
+        return [None]
+    try:
+        from pypdf import PdfReader
+        # Only the cross-reference table and page tree are read, not the content
+        total = len(PdfReader(source).pages)
+    except Exception:
+        return [None]
+    if total <= pages_per_call:
+        return [None]
+    ranges = []
+    for first in range(1, total + 1, pages_per_call):
+        last = min(first + pages_per_call - 1, total)
+        ranges.append(f"{first}-{last}" if last > first else f"{first}")
+    return ranges
+
+
+# Collections that "/<name>/<index>" element references point into
+_ELEMENT_COLLECTIONS = ("paragraphs", "tables", "figures", "sections")
+
+
+def _shift_refs(node, shift: int, counts: dict):
+    """
+    Move every span in a result dict ``shift`` characters later and
+    renumber element references past the ``counts`` already merged.
+    """
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, list):
+            stack.extend(node)
+        elif isinstance(node, dict):
+            if len(node) == 2 and "offset" in node and "length" in node:
+                node["offset"] += shift
+                continue
+            elements = node.get("elements")
+            if elements:
+                for i, ref in enumerate(elements):
+                    _, name, index = ref.split("/")
+                    elements[i] = f"/{name}/{int(index) + counts.get(name, 0)}"
+            stack.extend(node.values())
+
+
+def merge_results(parts) -> AnalyzeResult:
+    """
+    Stitch the results of consecutive page ranges into one result.
+
+    The contents are joined with a newline, every span after the first
+    part is shifted by the content that now precedes it (in code points,
+    which analyze_document() requests for page ranges), element
+    references are renumbered, and all list fields (pages, paragraphs,
+    tables, key-value pairs, styles, languages, ...) are concatenated.
+    """
+    merged = parts[0].as_dict()
+    contents = [merged.get("content", "")]
+    shift = len(contents[0]) + 1
+    for part in parts[1:]:
+        data = part.as_dict()
+        counts = {name: len(merged.get(name) or ())
+                  for name in _ELEMENT_COLLECTIONS}
+        _shift_refs(data, shift, counts)
+        for name, value in data.items():
+            if isinstance(value, list):
+                merged.setdefault(name, []).extend(value)
+        content = data.get("content", "")
+        contents.append(content)
+        shift += len(content) + 1
+    merged["content"] = "\n".join(contents)
+    return AnalyzeResult(merged)
+
+
+def check_sources(files, urls) -> list[str]:
+    """
+    Combine local files and URLs into one list of sources to analyze.
+    Exits with an error if a local file is missing or nothing was given.
+    """
+    for file_path in files:
+        if not os.path.exists(file_path):
+            print(f"ERROR: File not found: {file_path}")
+            exit(1)
+    sources = list(files) + list(urls or [])
+    if not sources:
+        print("ERROR: Provide at least one file path or --url.")
+        exit(1)
+    return sources
+
+
+def count_styles(styles) -> tuple[int, int]:
+    """
+    Count handwritten and printed style regions in a single pass.
+    Styles with no handwriting classification are not counted.
+    """
+    handwritten = printed = 0
+    for style in styles or ():
+        if style.is_handwritten:
+            handwritten += 1
+        elif style.is_handwritten is not None:
+            printed += 1
+    return handwritten, printed
+
+
+def summarize_languages(languages) -> list[tuple[str, int, float]]:
+    """
+    Aggregate detected languages by locale in a single pass.
+
+    Returns (locale, span_count, max_confidence) tuples, most spans first;
+    locales with equal counts keep their first-seen order.
+    """
+    summary = {}
+    for lang in languages or ():
+        entry = summary.get(lang.locale)
+        if entry is None:
+            summary[lang.locale] = [len(lang.spans), lang.confidence or 0]
+        else:
+            entry[0] += len(lang.spans)
+            if (lang.confidence or 0) > entry[1]:
+                entry[1] = lang.confidence
+    items = [(locale, count, conf) for locale, (count, conf) in summary.items()]
+    # Stable sort, so ties keep first-seen order
+    items.sort(key=itemgetter(1), reverse=True)
+    return items
+
+
+def analyze_many(client, paths, model_id: str, features=None,
+                 max_concurrency: int = DEFAULT_CONCURRENCY,
+                 pages_per_call: int | None = None):
+    """
+    Analyze several documents (paths or URLs) concurrently with one
+    shared client.
+
+    Each analysis is mostly spent waiting on the service, so up to
+    ``max_concurrency`` of them run on a thread pool. With
+    ``pages_per_call``, long local PDFs are also split into page ranges
+    that are analyzed side by side and merged back into one result.
+    Yields (path, result, error) triples in input order as soon as each
+    is available. A document that fails yields (path, None, exception),
+    so the others are still reported.
+    """
+    jobs = []
+    for path in paths:
+        try:
+            jobs.append((path, page_ranges(path, pages_per_call), None))
+        except Exception as exc:
+            jobs.append((path, [], exc))
+    calls = sum(len(ranges) for _, ranges, _ in jobs)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, calls))) as pool:
+        futures = [
+            [pool.submit(analyze_document, client, path, model_id,
+                         features, pages) for pages in ranges]
+            for path, ranges, _ in jobs
+        ]
+        for (path, _, error), parts in zip(jobs, futures):
+            result = None
+            if error is None:
+                try:
+                    results = [future.result() for future in parts]
+                    result = (results[0] if len(results) == 1
+                              else merge_results(results))
+                except Exception as exc:
+                    error = exc
+            yield path, result, error
+
+
+def write_error(source: str, error: Exception, as_json: bool = False,
+                out=None):
+    """
+    Report a document whose analysis failed to ``out`` (stdout by
+    default), in the chosen format.
+    """
+    if as_json:
+        write_json(source, {"error": str(error)}, out)
+    else:
+        (out or sys.stdout).write(
+            f"\nAnalyzing: {source}\n\n  ERROR: {error}\n"
+        )
+
+
+def write_report(source: str, print_report, result, out=None):
+    """
+    Render one document's human-readable report in memory, then write it
+    to ``out`` (stdout by default) with a single call instead of one per
+    printed line.
+    """
+    buf = io.StringIO()
+    buf.write(f"\nAnalyzing: {source}\n\n")
+    print_report(result, out=buf)
+    (out or sys.stdout).write(buf.getvalue())
+
+
+def write_json(source: str, summary: dict, out=None):
+    """
+    Write one document's summary to ``out`` (stdout by default) as a
+    single line of JSON.
+    """
+    (out or sys.stdout).write(orjson.dumps(
+        {"source": source, **summary}, option=orjson.OPT_APPEND_NEWLINE
+    ).decode())
+
+
+def process(paths, model_id: str, features, print_report, summarize,
+            client=None, concurrency: int = DEFAULT_CONCURRENCY,
+            as_json: bool = False, pages_per_call: int | None = None,
+            out=None) -> int:
+    """
+    Analyze every path or URL with ``model_id`` and write each document's
+    report (``print_report``) or, with as_json, its ``summarize`` output
+    as one JSON line, to ``out`` (stdout by default).
+
+    One client, and so its open connections, is reused for all of them;
+    if none is given, one is built and closed here. pages_per_call splits
+    long PDFs into page ranges analyzed in parallel. A failed document is
+    reported as an error and the rest carry on; returns the number that
+    failed.
+    """
+    if client is None:
+        # A client created here is closed here, releasing its connections
+        with make_client(*load_credentials()) as client:
+            return process(paths, model_id, features, print_report,
+                           summarize, client, concurrency, as_json,
+                           pages_per_call, out)
+
+    failures = 0
+    for file_path, result, error in analyze_many(
+            client, paths, model_id,
+            features=features,
+            max_concurrency=concurrency,
+            pages_per_call=pages_per_call):
+        if error is not None:
+            failures += 1
+            write_error(file_path, error, as_json, out)
+        elif as_json:
+            write_json(file_path, summarize(result), out)
+        else:
+            write_report(file_path, print_report, result, out)
+    return failures
+
+
+def add_common_args(parser, document: str = "PDF or image"):
+    """Add the input and output options shared by the analysis scripts."""
+    parser.add_argument("files", nargs="*", metavar="file",
+                        help=f"Path(s) to the {document} to analyze.")
+    parser.add_argument("--url", action="append", default=[],
+                        help="Analyze a document at this URL (the service "
+                             "fetches it, nothing is uploaded). Repeatable.")
+    parser.add_argument("--concurrency", "-c", type=int,
+                        default=DEFAULT_CONCURRENCY,
+                        help="Maximum number of documents analyzed at once "
+                             f"(default: {DEFAULT_CONCURRENCY}).")
+    parser.add_argument("--pages-per-call", type=int, metavar="N",
+                        help="Split PDFs longer than N pages into N-page "
+                             "ranges analyzed in parallel and merged back "
+                             "into one result (needs pypdf).")
+    parser.add_argument("--json", action="store_true",
+                        help="Write one compact JSON summary line per "
+                             "document instead of the formatted report.")
+
+
+def run_cli(parser, banner: list[str], model_id: str, features,
+            print_report, summarize):
+    """
+    Command-line entry point shared by the analysis scripts: parse the
+    options added by add_common_args(), print the ``banner`` lines, then
+    analyze every source and exit 1 if any of them failed.
+    """
+    args = parser.parse_args()
+    if args.pages_per_call is not None:
+        if args.pages_per_call < 1:
+            parser.error("--pages-per-call must be at least 1.")
+        if find_spec("pypdf") is None:
+            parser.error("--pages-per-call needs pypdf (pip install pypdf).")
+
+    # 1. Load Environment Variables
+    endpoint, key = load_credentials()
+
+    # 2. Check the input files and URLs
+    sources = check_sources(args.files, args.url)
+
+    # 3. Authenticate the Client
+    client = make_client(endpoint, key)
+
+    if not args.json:
+        print("=" * 60)
+        for line in banner:
+            print(line)
+        print("=" * 60)
+
+    # 4. Analyze Documents (concurrently when more than one is given)
+    with client:
+        failures = process(sources, model_id, features, print_report,
+                           summarize, client, concurrency=args.concurrency,
+                           as_json=args.json,
+                           pages_per_call=args.pages_per_call)
+    if failures:
+        if not args.json:
+            print(f"\nERROR: {failures} of {len(sources)} document(s) failed.")
+        exit(1)
@@ -1,131 +1,152 @@
-import os
 import sys
-from dotenv import load_dotenv
-from azure.core.credentials import AzureKeyCredential
-from azure.ai.documentintelligence import DocumentIntelligenceClient
+import argparse
+from functools import partial
 from azure.ai.documentintelligence.models import DocumentAnalysisFeature
-
-
-def main():
-    # 1. Load Environment Variables
-    load_dotenv()
-    endpoint = os.getenv("AZURE_DOCUMENT_INTELLIGENCE_ENDPOINT")
-    key = os.getenv("AZURE_DOCUMENT_INTELLIGENCE_KEY")
-
-    if not endpoint or not key:
-        print("ERROR: Missing credentials in .env file.")
-        exit(1)
-
-    # 2. Get file path from CLI argument
-    if len(sys.argv) < 2:
-        print("Usage: python extract_document.py <path_to_pdf>")
-        exit(1)
-
-    file_path = sys.argv[1]
-
-    if not os.path.exists(file_path):
-        print(f"ERROR: File not found: {file_path}")
-        exit(1)
-
-    # 3. Authenticate the Client
-    client = DocumentIntelligenceClient(endpoint=endpoint, credential=AzureKeyCredential(key))
-
-    print("=" * 60)
-    print("  ADD-ON FEATURES — Enhanced Data Extraction")
-    print("  Demonstrates: key-value pairs, font styles,")
-    print("  barcode detection, language detection")
-    print("=" * 60)
-    print(f"\nAnalyzing: {file_path}\n")
-
-    # 4. Analyze Document using prebuilt-layout with add-on features
-    #    The prebuilt-document model was retired in newer API versions.
-    #    Instead, we use prebuilt-layout with optional features enabled to
-    #    extract key-value pairs, font styles, barcodes, and languages.
-    features = [
-        DocumentAnalysisFeature.KEY_VALUE_PAIRS,
-        DocumentAnalysisFeature.STYLE_FONT,
-        DocumentAnalysisFeature.BARCODES,
-        DocumentAnalysisFeature.LANGUAGES,
-    ]
-    with open(file_path, "rb") as document_file:
-        poller = client.begin_analyze_document(
-            "prebuilt-layout", body=document_file, features=features
-        )
-    result = poller.result()
-
+from di_utils import (
+    add_common_args, count_styles, process as process_documents, run_cli,
+    summarize_languages,
+)
+
+
+# The prebuilt-document model was retired in newer API versions.
+# Instead, we use prebuilt-layout with optional features enabled to
+# extract key-value pairs, font styles, barcodes, and languages.
+FEATURES = [
+    DocumentAnalysisFeature.KEY_VALUE_PAIRS,
+    DocumentAnalysisFeature.STYLE_FONT,
+    DocumentAnalysisFeature.BARCODES,
+    DocumentAnalysisFeature.LANGUAGES,
+]
+
+
+def print_report(result, out=None):
+    """
+    Print the add-on feature analysis of one document to ``out``
+    (stdout by default).
+    """
+    if out is None:
+        out = sys.stdout
     # ============================================================
     # KEY-VALUE PAIRS (Form Fields)
     # ============================================================
-    print("--- KEY-VALUE PAIRS (Form Fields) ---\n")
+    print("--- KEY-VALUE PAIRS (Form Fields) ---\n", file=out)
     if result.key_value_pairs:
         for kv in result.key_value_pairs:
             key_text = kv.key.content.strip() if kv.key else "(no key)"
             value_text = kv.value.content.strip() if kv.value else "(empty)"
             confidence = kv.confidence if kv.confidence else 0
-            print(f"  {key_text}: {value_text}  ({confidence:.0%})")
+            print(f"  {key_text}: {value_text}  ({confidence:.0%})", file=out)
     else:
-        print("  No key-value pairs found.")
+        print("  No key-value pairs found.", file=out)
 
     # ============================================================
     # CONTENT STYLES (Handwritten vs Printed)
     # ============================================================
-    print("\n--- CONTENT STYLES ---\n")
+    print("\n--- CONTENT STYLES ---\n", file=out)
     if result.styles:
-        handwritten = [s for s in result.styles if s.is_handwritten]
-        printed = [s for s in result.styles if s.is_handwritten is not None and not s.is_handwritten]
+        handwritten, printed = count_styles(result.styles)
         if handwritten:
-            print(f"  Handwritten: {len(handwritten)} region(s) detected")
+            print(f"  Handwritten: {handwritten} region(s) detected", file=out)
         if printed:
-            print(f"  Printed:     {len(printed)} region(s) detected")
+            print(f"  Printed:     {printed} region(s) detected", file=out)
         if not handwritten and not printed:
-            print("  No handwriting/print classification detected.")
+            print("  No handwriting/print classification detected.", file=out)
     else:
-        print("  No style information detected.")
+        print("  No style information detected.", file=out)
 
     # ============================================================
     # BARCODES
     # ============================================================
-    print("\n--- BARCODES ---\n")
+    print("\n--- BARCODES ---\n", file=out)
     total_barcodes = 0
     for page in result.pages:
         if page.barcodes:
             total_barcodes += len(page.barcodes)
             for barcode in page.barcodes:
                 print(f"  Page {page.page_number}: [{barcode.kind}] {barcode.value} "
-                      f"({barcode.confidence:.0%})")
+                      f"({barcode.confidence:.0%})", file=out)
     if total_barcodes == 0:
-        print("  No barcodes found.")
+        print("  No barcodes found.", file=out)
 
     # ============================================================
     # LANGUAGES (aggregated by locale)
     # ============================================================
-    print("\n--- DETECTED LANGUAGES ---\n")
+    print("\n--- DETECTED LANGUAGES ---\n", file=out)
     if result.languages:
-        lang_summary = {}
-        for lang in result.languages:
-            locale = lang.locale
-            if locale not in lang_summary:
-                lang_summary[locale] = {"count": 0, "max_confidence": 0}
-            lang_summary[locale]["count"] += len(lang.spans)
-            lang_summary[locale]["max_confidence"] = max(
-                lang_summary[locale]["max_confidence"], lang.confidence
-            )
-        for locale, info in sorted(lang_summary.items(), key=lambda x: -x[1]["count"]):
-            print(f"  {locale}: {info['count']} span(s), "
-                  f"best confidence: {info['max_confidence']:.0%}")
+        lang_summary = summarize_languages(result.languages)
+        out.write("".join(
+            f"  {locale}: {count} span(s), "
+            f"best confidence: {max_confidence:.0%}\n"
+            for locale, count, max_confidence in lang_summary
+        ))
     else:
-        print("  No language information detected.")
+        print("  No language information detected.", file=out)
 
     # ============================================================
     # SUMMARY
     # ============================================================
-    print(f"\n--- SUMMARY ---\n")
-    print(f"  Pages:            {len(result.pages)}")
-    print(f"  Key-value pairs:  {len(result.key_value_pairs) if result.key_value_pairs else 0}")
-    print(f"  Barcodes:         {total_barcodes}")
-    print(f"  Languages:        {len(lang_summary) if result.languages else 0}")
-    print(f"  Model:            {result.model_id} (API {result.api_version})")
-    print(f"  Add-on features:  {', '.join(f.value for f in features)}")
+    print(f"\n--- SUMMARY ---\n", file=out)
+    print(f"  Pages:            {len(result.pages)}", file=out)
+    print(f"  Key-value pairs:  {len(result.key_value_pairs) if result.key_value_pairs else 0}", file=out)
+    print(f"  Barcodes:         {total_barcodes}", file=out)
+    print(f"  Languages:        {len(lang_summary) if result.languages else 0}", file=out)
+    print(f"  Model:            {result.model_id} (API {result.api_version})", file=out)
+    print(f"  Add-on features:  {', '.join(f.value for f in FEATURES)}", file=out)
+
+
+def summarize(result) -> dict:
+    """Collect one document's add-on feature results as plain data (--json)."""
+    handwritten, printed = count_styles(result.styles)
+    return {
+        "model_id": result.model_id,
+        "api_version": result.api_version,
+        "features": [f.value for f in FEATURES],
+        "pages": len(result.pages),
+        "key_value_pairs": [
+            {
+                "key": kv.key.content.strip() if kv.key else None,
+                "value": kv.value.content.strip() if kv.value else None,
+                "confidence": kv.confidence or 0,
+            }
+            for kv in result.key_value_pairs or ()
+        ],
+        "styles": {"handwritten": handwritten, "printed": printed},
+        "barcodes": [
+            {
+                "page_number": page.page_number,
+                "kind": barcode.kind,
+                "value": barcode.value,
+                "confidence": barcode.confidence,
+            }
+            for page in result.pages
+            for barcode in page.barcodes or ()
+        ],
+        "languages": [
+            {"locale": locale, "spans": count, "confidence": confidence}
+            for locale, count, confidence in summarize_languages(result.languages)
+        ],
+    }
+
+
+# Analyze and write reports with this script's model (see di_utils.process)
+process = partial(
+    process_documents, model_id="prebuilt-layout", features=FEATURES,
+    print_report=print_report, summarize=summarize,
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Extract key-value pairs, styles, barcodes, and languages "
+                    "with prebuilt-layout add-on features.",
+    )
+    add_common_args(parser, "PDF or image")
+    banner = [
+        "  ADD-ON FEATURES — Enhanced Data Extraction",
+        "  Demonstrates: key-value pairs, font styles,",
+        "  barcode detection, language detection",
+    ]
+    run_cli(parser, banner, "prebuilt-layout", FEATURES, print_report, summarize)
 
 
 if __name__ == "__main__":
@@ -1,75 +1,56 @@
-import os
 import sys
-from dotenv import load_dotenv
-from azure.core.credentials import AzureKeyCredential
-from azure.ai.documentintelligence import DocumentIntelligenceClient
+import argparse
+from functools import partial
+from di_utils import (
+    add_common_args, process as process_documents, run_cli,
+)
 
 
-def print_formatted_table(table):
-    """Helper function to print tables in a clean, readable grid."""
-    print(f"\n[Table: {table.row_count} rows x {table.column_count} columns]")
+def _fit_cell(text):
+    """Truncate a cell to 30 characters and pad it to the column width."""
+    return f"{text[:27] + '...' if len(text) > 30 else text:<30}"
+
 
+def table_grid(table) -> list[list[str]]:
+    """Lay a table's cells out as rows of single-line strings."""
     # Create an empty grid
-    grid = [["" for _ in range(table.column_count)] for _ in range(table.row_count)]
+    grid = [[""] * table.column_count for _ in range(table.row_count)]
 
     # Populate the grid with cell content
     for cell in table.cells:
-        clean_content = cell.content.replace('\n', ' ').strip()
-        grid[cell.row_index][cell.column_index] = clean_content
-
-    # Print the grid
-    for row_idx, row in enumerate(grid):
-        formatted_row = " | ".join(f"{col[:27] + '...' if len(col) > 30 else col:<30}" for col in row)
-        print(f"| {formatted_row} |")
-
-        if row_idx == 0:
-            separator = "-+-".join("-" * 30 for _ in range(table.column_count))
-            print(f"|-{separator}-|")
-    print()
-
-
-def main():
-    # 1. Load Environment Variables
-    load_dotenv()
-    endpoint = os.getenv("AZURE_DOCUMENT_INTELLIGENCE_ENDPOINT")
-    key = os.getenv("AZURE_DOCUMENT_INTELLIGENCE_KEY")
-
-    if not endpoint or not key:
-        print("ERROR: Missing credentials in .env file.")
-        exit(1)
-
-    # 2. Get file path from CLI argument
-    if len(sys.argv) < 2:
-        print("Usage: python extract_layout.py <path_to_pdf>")
-        exit(1)
-
-    file_path = sys.argv[1]
+        grid[cell.row_index][cell.column_index] = cell.content.replace('\n', ' ').strip()
+    return grid
 
-    if not os.path.exists(file_path):
-        print(f"ERROR: File not found: {file_path}")
-        exit(1)
-
-    # 3. Authenticate the Client
-    client = DocumentIntelligenceClient(endpoint=endpoint, credential=AzureKeyCredential(key))
-
-    print("=" * 60)
-    print("  LAYOUT MODEL — Visual Structure & Document Organization")
-    print("  Demonstrates: paragraphs, semantic roles, tables,")
-    print("  selection marks (checkboxes), page structure")
-    print("=" * 60)
-    print(f"\nAnalyzing: {file_path}\n")
-
-    # 4. Analyze Document
-    with open(file_path, "rb") as document_file:
-        poller = client.begin_analyze_document("prebuilt-layout", body=document_file)
-    result = poller.result()
 
+def print_formatted_table(table, out=None):
+    """Helper function to print tables in a clean, readable grid."""
+    if out is None:
+        out = sys.stdout
+    grid = table_grid(table)
+
+    # Render every row, then write the whole table at once
+    lines = [f"\n[Table: {table.row_count} rows x {table.column_count} columns]"]
+    lines.extend("| " + " | ".join(map(_fit_cell, row)) + " |" for row in grid)
+    if grid:
+        separator = "-+-".join(["-" * 30] * table.column_count)
+        lines.insert(2, f"|-{separator}-|")
+    lines.append("\n")
+    out.write("\n".join(lines))
+
+
+def print_report(result, out=None):
+    """
+    Print the layout analysis of one document to ``out``
+    (stdout by default).
+    """
+    if out is None:
+        out = sys.stdout
     total_selection_marks = 0
 
     # ============================================================
     # DOCUMENT STRUCTURE (Paragraphs with semantic roles)
     # ============================================================
-    print("--- DOCUMENT STRUCTURE (Semantic Roles) ---\n")
+    print("--- DOCUMENT STRUCTURE (Semantic Roles) ---\n", file=out)
 
     if result.paragraphs:
         for paragraph in result.paragraphs:
@@ -77,48 +58,91 @@ def main():
             content = paragraph.content.replace('\n', ' ')
 
             if role == "title":
-                print(f"\n# {content.upper()}")
-                print("=" * (len(content) + 2))
+                print(f"\n# {content.upper()}", file=out)
+                print("=" * (len(content) + 2), file=out)
             elif role == "sectionHeading":
-                print(f"\n## {content}")
+                print(f"\n## {content}", file=out)
             elif role in ["pageHeader", "pageFooter", "pageNumber"]:
                 continue
             else:
-                print(f"{content}")
+                print(f"{content}", file=out)
 
     # ============================================================
     # DATA TABLES
     # ============================================================
-    print("\n\n--- TABLES ---")
+    print("\n\n--- TABLES ---", file=out)
     if result.tables:
         for table in result.tables:
-            print_formatted_table(table)
+            print_formatted_table(table, out)
     else:
-        print("No tables found.\n")
+        print("No tables found.\n", file=out)
 
     # ============================================================
     # SELECTION MARKS (Checkboxes)
     # ============================================================
-    print("--- SELECTION MARKS (Checkboxes) ---\n")
+    print("--- SELECTION MARKS (Checkboxes) ---\n", file=out)
     for page in result.pages:
         if page.selection_marks:
             marks = page.selection_marks
             total_selection_marks += len(marks)
             selected = sum(1 for m in marks if m.state == "selected")
             print(f"  Page {page.page_number}: {len(marks)} checkbox(es) "
-                  f"— {selected} checked, {len(marks) - selected} unchecked")
+                  f"— {selected} checked, {len(marks) - selected} unchecked", file=out)
     if total_selection_marks == 0:
-        print("  No selection marks found.")
+        print("  No selection marks found.", file=out)
 
     # ============================================================
     # SUMMARY
     # ============================================================
-    print(f"\n--- SUMMARY ---\n")
-    print(f"  Pages:            {len(result.pages)}")
-    print(f"  Paragraphs:       {len(result.paragraphs) if result.paragraphs else 0}")
-    print(f"  Tables:           {len(result.tables) if result.tables else 0}")
-    print(f"  Selection marks:  {total_selection_marks}")
-    print(f"  Model:            {result.model_id} (API {result.api_version})")
+    print(f"\n--- SUMMARY ---\n", file=out)
+    print(f"  Pages:            {len(result.pages)}", file=out)
+    print(f"  Paragraphs:       {len(result.paragraphs) if result.paragraphs else 0}", file=out)
+    print(f"  Tables:           {len(result.tables) if result.tables else 0}", file=out)
+    print(f"  Selection marks:  {total_selection_marks}", file=out)
+    print(f"  Model:            {result.model_id} (API {result.api_version})", file=out)
+
+
+def summarize(result) -> dict:
+    """Collect the layout analysis of one document as plain data (--json)."""
+    pages = []
+    for page in result.pages:
+        marks = page.selection_marks or ()
+        pages.append({
+            "page_number": page.page_number,
+            "selection_marks": len(marks),
+            "selected": sum(1 for m in marks if m.state == "selected"),
+        })
+    return {
+        "model_id": result.model_id,
+        "api_version": result.api_version,
+        "paragraphs": [
+            {"role": p.role or "text", "content": p.content}
+            for p in result.paragraphs or ()
+        ],
+        "tables": [table_grid(table) for table in result.tables or ()],
+        "pages": pages,
+    }
+
+
+# Analyze and write reports with this script's model (see di_utils.process)
+process = partial(
+    process_documents, model_id="prebuilt-layout", features=None,
+    print_report=print_report, summarize=summarize,
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Extract paragraphs, tables, and checkboxes with the "
+                    "prebuilt-layout model.",
+    )
+    add_common_args(parser, "PDF or image")
+    banner = [
+        "  LAYOUT MODEL — Visual Structure & Document Organization",
+        "  Demonstrates: paragraphs, semantic roles, tables,",
+        "  selection marks (checkboxes), page structure",
+    ]
+    run_cli(parser, banner, "prebuilt-layout", None, print_report, summarize)
 
 
 if __name__ == "__main__":
@@ -15,42 +15,71 @@ Usage:
   python ocr_handwriting.py <path_to_image_or_pdf>
   python ocr_handwriting.py scan.jpg
   python ocr_handwriting.py form.pdf
+  python ocr_handwriting.py scans/*.jpg --concurrency 4
 """
 
-import os
 import sys
-from dotenv import load_dotenv
-from azure.core.credentials import AzureKeyCredential
-from azure.ai.documentintelligence import DocumentIntelligenceClient
+import argparse
+from bisect import bisect_right
+from functools import lru_cache, partial
 from azure.ai.documentintelligence.models import DocumentAnalysisFeature
+from di_utils import (
+    add_common_args, count_styles, process as process_documents, run_cli,
+    summarize_languages,
+)
+
+
+# prebuilt-read is purpose-built for OCR-heavy scenarios: scanned paper,
+# faxes, photographed documents, handwritten notes. The style and language
+# add-ons supply the handwriting classification and locale detection.
+FEATURES = [
+    DocumentAnalysisFeature.STYLE_FONT,
+    DocumentAnalysisFeature.LANGUAGES,
+]
+
+
+@lru_cache(maxsize=None)
+def _bars(width: int) -> tuple[str, ...]:
+    """Every bar of the given width, indexed by the number of filled cells."""
+    return tuple("█" * filled + "░" * (width - filled) for filled in range(width + 1))
+
+
+_BARS = _bars(20)
 
 
 def confidence_bar(score: float, width: int = 20) -> str:
-    filled = int(score * width)
-    return "█" * filled + "░" * (width - filled)
+    bars = _BARS if width == 20 else _bars(width)
+    return bars[min(width, max(0, int(score * width)))]
 
 
 def classify_spans(styles) -> dict:
     """
-    Build a set of character offsets that are handwritten vs. printed
-    from the styles array returned by DI.
+    Build the handwritten and printed character maps from the styles
+    array returned by DI.
+
+    Each entry is a bytearray with one byte per character offset, set to
+    1 where that offset is covered, so overlapping spans count once and
+    counting covered characters in a range is a single C-level scan.
     """
-    handwritten_offsets = set()
-    printed_offsets = set()
+    size = max((span.offset + span.length
+                for style in styles or ()
+                for span in style.spans or ()), default=0)
+    handwritten = bytearray(size)
+    printed = bytearray(size)
+
+    for style in styles or ():
+        if style.is_handwritten is None or not style.spans:
+            continue
+        target = handwritten if style.is_handwritten else printed
+        for span in style.spans:
+            target[span.offset:span.offset + span.length] = b"\x01" * span.length
 
-    if not styles:
-        return {"handwritten": handwritten_offsets, "printed": printed_offsets}
+    return {"handwritten": handwritten, "printed": printed}
 
-    for style in styles:
-        if style.is_handwritten is None:
-            continue
-        target = handwritten_offsets if style.is_handwritten else printed_offsets
-        if style.spans:
-            for span in style.spans:
-                for offset in range(span.offset, span.offset + span.length):
-                    target.add(offset)
 
-    return {"handwritten": handwritten_offsets, "printed": printed_offsets}
+def covered_chars(bits: bytearray) -> int:
+    """Number of character offsets covered in a span bitmap."""
+    return bits.count(1)
 
 
 def word_is_handwritten(word, span_map: dict) -> bool | None:
@@ -62,8 +91,8 @@ def word_is_handwritten(word, span_map: dict) -> bool | None:
         return None
     start = word.span.offset
     end = start + word.span.length
-    hw_count = sum(1 for o in range(start, end) if o in span_map["handwritten"])
-    pr_count = sum(1 for o in range(start, end) if o in span_map["printed"])
+    hw_count = span_map["handwritten"].count(1, start, end)
+    pr_count = span_map["printed"].count(1, start, end)
     if hw_count > pr_count:
         return True
     elif pr_count > hw_count:
@@ -71,140 +100,173 @@ def word_is_handwritten(word, span_map: dict) -> bool | None:
     return None
 
 
-def main():
-    # 1. Load Environment Variables
-    load_dotenv()
-    endpoint = os.getenv("AZURE_DOCUMENT_INTELLIGENCE_ENDPOINT")
-    key = os.getenv("AZURE_DOCUMENT_INTELLIGENCE_KEY")
-
-    if not endpoint or not key:
-        print("ERROR: Missing credentials in .env file.")
-        exit(1)
-
-    # 2. Get file path from CLI argument
-    if len(sys.argv) < 2:
-        print("Usage: python ocr_handwriting.py <path_to_image_or_pdf>")
-        exit(1)
+def assign_words_to_lines(words, lines) -> list[list]:
+    """
+    Group a page's words by the line whose spans contain their start offset.
 
-    file_path = sys.argv[1]
+    Line spans are flattened and sorted once, then merged against the
+    words in a single sweep: the service returns words in reading order,
+    so the span pointer only ever moves forward. A word that goes back
+    in the content falls back to a binary search for its span.
+    Returns one list per line, with words in page order.
+    """
+    flat = sorted(
+        (s.offset, s.offset + s.length, line_idx)
+        for line_idx, line in enumerate(lines)
+        for s in (line.spans or ())
+    )
+    starts = [start for start, _, _ in flat]
+    last = len(starts) - 1
+
+    words_by_line = [[] for _ in lines]
+    i = -1              # last span starting at or before the previous word
+    prev_offset = -1
+    for word in words:
+        if not word.span:
+            continue
+        offset = word.span.offset
+        if offset < prev_offset:
+            i = bisect_right(starts, offset) - 1
+        else:
+            while i < last and starts[i + 1] <= offset:
+                i += 1
+        prev_offset = offset
+        if i >= 0 and offset < flat[i][1]:
+            words_by_line[flat[i][2]].append(word)
+    return words_by_line
 
-    if not os.path.exists(file_path):
-        print(f"ERROR: File not found: {file_path}")
-        exit(1)
 
-    # 3. Authenticate the Client
-    client = DocumentIntelligenceClient(
-        endpoint=endpoint, credential=AzureKeyCredential(key)
-    )
+def page_stats(page, span_map: dict) -> dict:
+    """
+    Classify a page's words once and gather everything reported about it:
+    its words and lines, the handwritten / printed / unclassified words,
+    and the sum of the word confidences.
+    """
+    words = page.words or []
+    hw_words = []
+    pr_words = []
+    unknown_words = []
+    conf_total = 0
+
+    for word in words:
+        conf_total += word.confidence or 0
+        hw = word_is_handwritten(word, span_map)
+        if hw is True:
+            hw_words.append(word)
+        elif hw is False:
+            pr_words.append(word)
+        else:
+            unknown_words.append(word)
 
-    print("=" * 60)
-    print("  OCR & HANDWRITING RECOGNITION")
-    print("  Model: prebuilt-read (optimized for text + handwriting)")
-    print("  Add-ons: STYLE_FONT, LANGUAGES")
-    print("=" * 60)
-    print(f"\nAnalyzing: {file_path}\n")
-
-    # 4. Analyze with prebuilt-read + style and language add-ons
-    #    prebuilt-read is purpose-built for OCR-heavy scenarios:
-    #    scanned paper, faxes, photographed documents, handwritten notes.
-    features = [
-        DocumentAnalysisFeature.STYLE_FONT,
-        DocumentAnalysisFeature.LANGUAGES,
-    ]
+    return {
+        "page_number": page.page_number,
+        "words": words,
+        "lines": page.lines or [],
+        "hw_words": hw_words,
+        "pr_words": pr_words,
+        "unknown_words": unknown_words,
+        "conf_total": conf_total,
+    }
 
-    with open(file_path, "rb") as document_file:
-        poller = client.begin_analyze_document(
-            "prebuilt-read", body=document_file, features=features
-        )
-    result = poller.result()
 
+def distinct_fonts(styles) -> dict:
+    """
+    Map each distinct (font, weight, style) among the styles that carry a
+    font style or weight to the confidence of its first occurrence.
+    """
+    # The SDK models always define these attributes, None when absent
+    fonts = {}
+    for style in styles or ():
+        if style.font_style or style.font_weight:
+            key = (style.similar_font_family or "unknown",
+                   style.font_weight or "normal",
+                   style.font_style or "normal")
+            fonts.setdefault(key, style.confidence or 0)
+    return fonts
+
+
+def print_report(result, out=None):
+    """
+    Print the OCR and handwriting analysis of one document to ``out``
+    (stdout by default).
+    """
+    if out is None:
+        out = sys.stdout
     # ── Build handwritten/printed span map ──
     span_map = classify_spans(result.styles)
 
     # ============================================================
     # HANDWRITING vs. PRINTED DETECTION
     # ============================================================
-    print("--- HANDWRITING vs. PRINTED DETECTION ---\n")
+    print("--- HANDWRITING vs. PRINTED DETECTION ---\n", file=out)
 
     if result.styles:
-        hw_styles = [s for s in result.styles if s.is_handwritten]
-        pr_styles = [s for s in result.styles
-                     if s.is_handwritten is not None and not s.is_handwritten]
+        hw_styles, pr_styles = count_styles(result.styles)
 
-        hw_chars = len(span_map["handwritten"])
-        pr_chars = len(span_map["printed"])
+        hw_chars = covered_chars(span_map["handwritten"])
+        pr_chars = covered_chars(span_map["printed"])
         total_chars = hw_chars + pr_chars or 1
 
-        print(f"  Handwritten regions: {len(hw_styles)}")
-        print(f"  Printed regions:     {len(pr_styles)}")
-        print(f"  Handwritten chars:   {hw_chars} ({hw_chars/total_chars:.0%})")
-        print(f"  Printed chars:       {pr_chars} ({pr_chars/total_chars:.0%})")
+        print(f"  Handwritten regions: {hw_styles}", file=out)
+        print(f"  Printed regions:     {pr_styles}", file=out)
+        print(f"  Handwritten chars:   {hw_chars} ({hw_chars/total_chars:.0%})", file=out)
+        print(f"  Printed chars:       {pr_chars} ({pr_chars/total_chars:.0%})", file=out)
 
         if hw_chars > 0:
-            print(f"\n  [ {'HANDWRITING DETECTED':^40} ]")
+            print(f"\n  [ {'HANDWRITING DETECTED':^40} ]", file=out)
         else:
-            print(f"\n  [ {'NO HANDWRITING — all printed':^40} ]")
+            print(f"\n  [ {'NO HANDWRITING — all printed':^40} ]", file=out)
     else:
-        print("  No style information available (style detection not supported")
-        print("  for this file type or region).")
+        print("  No style information available (style detection not supported", file=out)
+        print("  for this file type or region).", file=out)
 
     # ============================================================
     # PER-PAGE OCR RESULTS
     # ============================================================
-    print(f"\n--- PER-PAGE OCR RESULTS ({len(result.pages)} pages) ---\n")
+    print(f"\n--- PER-PAGE OCR RESULTS ({len(result.pages)} pages) ---\n", file=out)
 
     total_words = 0
     total_hw_words = 0
-    all_confidences = []
+    total_conf = 0
+    # Per-page results, reused for the consolidated text below
+    all_stats = []
 
     for page in result.pages:
-        words = page.words or []
-        lines = page.lines or []
-        total_words += len(words)
-
         # Classify words on this page
-        hw_words = []
-        pr_words = []
-        unknown_words = []
-
-        for word in words:
-            all_confidences.append(word.confidence or 0)
-            hw = word_is_handwritten(word, span_map)
-            if hw is True:
-                hw_words.append(word)
-            elif hw is False:
-                pr_words.append(word)
-            else:
-                unknown_words.append(word)
+        stats = page_stats(page, span_map)
+        all_stats.append(stats)
+        words = stats["words"]
+        lines = stats["lines"]
+        hw_words = stats["hw_words"]
+        pr_words = stats["pr_words"]
+        unknown_words = stats["unknown_words"]
 
+        total_words += len(words)
         total_hw_words += len(hw_words)
-
-        page_conf = (sum(w.confidence or 0 for w in words) / len(words)) if words else 0
-
-        print(f"  Page {page.page_number}")
-        print(f"    Dimensions:  {page.width} x {page.height} {page.unit or ''}")
-        print(f"    Lines:       {len(lines)}")
-        print(f"    Words:       {len(words)}")
-        print(f"    Avg conf:    {page_conf:.1%}  {confidence_bar(page_conf)}")
-        print(f"    Handwritten: {len(hw_words)} word(s)")
-        print(f"    Printed:     {len(pr_words)} word(s)")
+        total_conf += stats["conf_total"]
+        hw_ids = {id(w) for w in hw_words}
+
+        page_conf = stats["conf_total"] / len(words) if words else 0
+
+        print(f"  Page {page.page_number}", file=out)
+        print(f"    Dimensions:  {page.width} x {page.height} {page.unit or ''}", file=out)
+        print(f"    Lines:       {len(lines)}", file=out)
+        print(f"    Words:       {len(words)}", file=out)
+        print(f"    Avg conf:    {page_conf:.1%}  {confidence_bar(page_conf)}", file=out)
+        print(f"    Handwritten: {len(hw_words)} word(s)", file=out)
+        print(f"    Printed:     {len(pr_words)} word(s)", file=out)
         if unknown_words:
-            print(f"    Unclassified:{len(unknown_words)} word(s)")
+            print(f"    Unclassified:{len(unknown_words)} word(s)", file=out)
 
         # ── Show lines with handwriting tags ──
         if lines:
-            print(f"\n    --- Lines (page {page.page_number}) ---\n")
-            for line_idx, line in enumerate(lines):
+            print(f"\n    --- Lines (page {page.page_number}) ---\n", file=out)
+            words_by_line = assign_words_to_lines(words, lines)
+            for line, line_words in zip(lines, words_by_line):
                 text = line.content
 
                 # Check if this line is handwritten
-                line_words = [w for w in words
-                              if w.span and line.spans
-                              and any(w.span.offset >= s.offset
-                                      and w.span.offset < s.offset + s.length
-                                      for s in line.spans)]
-
-                hw_count = sum(1 for w in line_words if word_is_handwritten(w, span_map) is True)
+                hw_count = sum(1 for w in line_words if id(w) in hw_ids)
                 total_in_line = len(line_words) or 1
 
                 if hw_count / total_in_line > 0.5:
@@ -221,97 +283,137 @@ def main():
                 if len(text) > 90:
                     display_text += " …"
 
-                print(f"    {tag} {line_conf:.0%} │ {display_text}")
+                print(f"    {tag} {line_conf:.0%} │ {display_text}", file=out)
 
-        print()
+        print(file=out)
 
     # ============================================================
     # FONT STYLE DETAILS
     # ============================================================
-    print("--- FONT STYLE DETAILS ---\n")
+    print("--- FONT STYLE DETAILS ---\n", file=out)
 
     if result.styles:
-        font_styles = [s for s in result.styles
-                       if getattr(s, "font_style", None) or getattr(s, "font_weight", None)]
-        if font_styles:
-            seen = set()
-            for style in font_styles:
-                font = getattr(style, "similar_font_family", None) or "unknown"
-                weight = getattr(style, "font_weight", None) or "normal"
-                fstyle = getattr(style, "font_style", None) or "normal"
-                key = (font, weight, fstyle)
-                if key not in seen:
-                    seen.add(key)
-                    conf = style.confidence or 0
-                    print(f"  Font: {font}, Weight: {weight}, "
-                          f"Style: {fstyle}, Confidence: {conf:.0%}")
+        fonts = distinct_fonts(result.styles)
+        if fonts:
+            out.write("".join(
+                f"  Font: {font}, Weight: {weight}, "
+                f"Style: {fstyle}, Confidence: {conf:.0%}\n"
+                for (font, weight, fstyle), conf in fonts.items()
+            ))
         else:
-            print("  No detailed font styles detected.")
+            print("  No detailed font styles detected.", file=out)
     else:
-        print("  No style data available.")
+        print("  No style data available.", file=out)
 
     # ============================================================
     # DETECTED LANGUAGES
     # ============================================================
-    print("\n--- DETECTED LANGUAGES ---\n")
+    print("\n--- DETECTED LANGUAGES ---\n", file=out)
 
     if result.languages:
-        lang_summary = {}
-        for lang in result.languages:
-            locale = lang.locale
-            if locale not in lang_summary:
-                lang_summary[locale] = {"count": 0, "max_confidence": 0}
-            lang_summary[locale]["count"] += len(lang.spans)
-            lang_summary[locale]["max_confidence"] = max(
-                lang_summary[locale]["max_confidence"], lang.confidence
-            )
-        for locale, info in sorted(lang_summary.items(), key=lambda x: -x[1]["count"]):
-            print(f"  {locale}: {info['count']} span(s), "
-                  f"best confidence: {info['max_confidence']:.0%}")
+        lang_summary = summarize_languages(result.languages)
+        out.write("".join(
+            f"  {locale}: {count} span(s), "
+            f"best confidence: {max_confidence:.0%}\n"
+            for locale, count, max_confidence in lang_summary
+        ))
     else:
-        print("  No language information detected.")
+        print("  No language information detected.", file=out)
 
     # ============================================================
     # HANDWRITTEN TEXT (consolidated)
     # ============================================================
     if total_hw_words > 0:
-        print("\n--- HANDWRITTEN TEXT (extracted) ---\n")
-        print("  The following text was identified as handwritten:\n")
+        print("\n--- HANDWRITTEN TEXT (extracted) ---\n", file=out)
+        print("  The following text was identified as handwritten:\n", file=out)
 
-        for page in result.pages:
-            words = page.words or []
-            hw_on_page = [w for w in words if word_is_handwritten(w, span_map) is True]
+        for stats in all_stats:
+            hw_on_page = stats["hw_words"]
             if hw_on_page:
                 # Reconstruct handwritten text from consecutive words
                 hw_text = " ".join(w.content for w in hw_on_page)
                 avg_conf = sum(w.confidence or 0 for w in hw_on_page) / len(hw_on_page)
-                print(f"  Page {page.page_number} ({len(hw_on_page)} words, "
-                      f"avg confidence: {avg_conf:.0%}):")
+                print(f"  Page {stats['page_number']} ({len(hw_on_page)} words, "
+                      f"avg confidence: {avg_conf:.0%}):", file=out)
                 # Wrap long text
                 words_list = hw_text.split()
                 line = "    "
                 for word in words_list:
                     if len(line) + len(word) + 1 > 80:
-                        print(line)
+                        print(line, file=out)
                         line = "    "
                     line += word + " "
                 if line.strip():
-                    print(line)
-                print()
+                    print(line, file=out)
+                print(file=out)
 
     # ============================================================
     # SUMMARY
     # ============================================================
-    print("--- SUMMARY ---\n")
-    avg_conf = sum(all_confidences) / len(all_confidences) if all_confidences else 0
-    print(f"  Pages:             {len(result.pages)}")
-    print(f"  Total words:       {total_words}")
-    print(f"  Handwritten words: {total_hw_words}")
-    print(f"  Printed words:     {total_words - total_hw_words}")
-    print(f"  Avg word conf:     {avg_conf:.1%}  {confidence_bar(avg_conf)}")
-    print(f"  Languages:         {len(result.languages) if result.languages else 0}")
-    print(f"  Model:             {result.model_id} (API {result.api_version})")
-    print(f"  Add-on features:   {', '.join(f.value for f in features)}")
+    print("--- SUMMARY ---\n", file=out)
+    avg_conf = total_conf / total_words if total_words else 0
+    print(f"  Pages:             {len(result.pages)}", file=out)
+    print(f"  Total words:       {total_words}", file=out)
+    print(f"  Handwritten words: {total_hw_words}", file=out)
+    print(f"  Printed words:     {total_words - total_hw_words}", file=out)
+    print(f"  Avg word conf:     {avg_conf:.1%}  {confidence_bar(avg_conf)}", file=out)
+    print(f"  Languages:         {len(result.languages) if result.languages else 0}", file=out)
+    print(f"  Model:             {result.model_id} (API {result.api_version})", file=out)
+    print(f"  Add-on features:   {', '.join(f.value for f in FEATURES)}", file=out)
+
+
+def summarize(result) -> dict:
+    """Collect one document's OCR and handwriting results as plain data (--json)."""
+    span_map = classify_spans(result.styles)
+    pages = []
+    for page in result.pages:
+        stats = page_stats(page, span_map)
+        words = stats["words"]
+        pages.append({
+            "page_number": stats["page_number"],
+            "lines": len(stats["lines"]),
+            "words": len(words),
+            "handwritten_words": len(stats["hw_words"]),
+            "printed_words": len(stats["pr_words"]),
+            "avg_confidence": stats["conf_total"] / len(words) if words else 0,
+            "handwritten_text": " ".join(w.content for w in stats["hw_words"]),
+        })
+    return {
+        "model_id": result.model_id,
+        "api_version": result.api_version,
+        "features": [f.value for f in FEATURES],
+        "handwritten_chars": covered_chars(span_map["handwritten"]),
+        "printed_chars": covered_chars(span_map["printed"]),
+        "pages": pages,
+        "fonts": [
+            {"font": font, "weight": weight, "style": fstyle, "confidence": conf}
+            for (font, weight, fstyle), conf in distinct_fonts(result.styles).items()
+        ],
+        "languages": [
+            {"locale": locale, "spans": count, "confidence": confidence}
+            for locale, count, confidence in summarize_languages(result.languages)
+        ],
+    }
+
+
+# Analyze and write reports with this script's model (see di_utils.process)
+process = partial(
+    process_documents, model_id="prebuilt-read", features=FEATURES,
+    print_report=print_report, summarize=summarize,
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="OCR and handwriting detection with the prebuilt-read model.",
+    )
+    add_common_args(parser, "image or PDF")
+    banner = [
+        "  OCR & HANDWRITING RECOGNITION",
+        "  Model: prebuilt-read (optimized for text + handwriting)",
+        "  Add-ons: STYLE_FONT, LANGUAGES",
+    ]
+    run_cli(parser, banner, "prebuilt-read", FEATURES, print_report, summarize)
 
 
 if __name__ == "__main__":